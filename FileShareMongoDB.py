@@ -1,10 +1,36 @@
 import os
-from typing import List, Dict
-from datetime import datetime
-from pymongo import MongoClient
+import re
+import sys
+import json
+import queue
+import logging
+import hmac
+import html
+import math
+import time
+import bisect
+import heapq
+import signal
+import socket
+import asyncio
+import functools
+import itertools
+from collections import OrderedDict, deque
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from aiohttp import web
+from bson import ObjectId
+from bson.errors import InvalidId
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, DeleteOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo import monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
+from telegram.ext import Application, BasePersistence, BaseRateLimiter, BaseUpdateProcessor, PersistenceInput, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
 
 # MongoDB Configuration
 MONGO_URI = os.getenv("MONGO_URI", "mongodb+srv://0")
@@ -15,19 +41,855 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "0")
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))  # Set your Telegram user ID
 STORAGE_CHANNEL_ID = int(os.getenv("STORAGE_CHANNEL_ID", "0"))  # Private channel ID for file storage
 
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Update delivery mode
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public base URL, e.g. https://bot.example.com (empty = don't register)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Checked against X-Telegram-Bot-Api-Secret-Token, required in webhook mode
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Parallel connections Telegram may open
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))  # Updates processed at the same time (same user stays in order)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus endpoint port in polling mode, 0 disables (webhook mode serves /metrics)
+
+# Force subscribe cache configuration (seconds)
+FSUB_MEMBER_TTL = int(os.getenv("FSUB_MEMBER_TTL", "300"))  # How long a confirmed membership is trusted
+FSUB_CHANNEL_INFO_TTL = int(os.getenv("FSUB_CHANNEL_INFO_TTL", "3600"))  # Channel title / invite link cache
+FSUB_CHECK_TIMEOUT = float(os.getenv("FSUB_CHECK_TIMEOUT", "5"))  # Seconds one membership lookup may take
+FSUB_FAIL_OPEN = os.getenv("FSUB_FAIL_OPEN", "0") == "1"  # 1 = let users through when a lookup fails, 0 = show the join wall
+
+# Admin / force subscribe cache configuration
+CACHE_REFRESH_INTERVAL = int(os.getenv("CACHE_REFRESH_INTERVAL", "60"))  # Seconds between reloads (keeps replicas in sync), 0 disables
+CACHE_CHANGE_STREAM = os.getenv("CACHE_CHANGE_STREAM", "0") == "1"  # Reload on MongoDB change events (needs a replica set)
+
+# User activity configuration
+LAST_ACTIVE_INTERVAL = int(os.getenv("LAST_ACTIVE_INTERVAL", "300"))  # Min seconds between last_active writes per user
+
+# New user notification configuration
+NEW_USER_DIGEST_INTERVAL = int(os.getenv("NEW_USER_DIGEST_INTERVAL", "0"))  # Seconds per admin digest, 0 = one message per new user
+ADMIN_NOTIFY_RATE = float(os.getenv("ADMIN_NOTIFY_RATE", "5"))  # Max notification messages per second
+
+# Search configuration
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))  # Results per search page
+SEARCH_INDEX_REFRESH = int(os.getenv("SEARCH_INDEX_REFRESH", "600"))  # Seconds between full index rebuilds, 0 disables
+
+# View counter configuration
+VIEW_FLUSH_INTERVAL = int(os.getenv("VIEW_FLUSH_INTERVAL", "30"))  # Seconds between buffered view count writes
+VIEW_DAILY_BUCKETS = os.getenv("VIEW_DAILY_BUCKETS", "0") == "1"  # Also keep per-day view counts per batch
+
+# Batch cache configuration
+BATCH_CACHE_MAX_FILES = int(os.getenv("BATCH_CACHE_MAX_FILES", "50000"))  # Total file entries held in the batch cache
+BATCH_CACHE_TTL = int(os.getenv("BATCH_CACHE_TTL", "600"))  # Seconds a cached batch is trusted
+
+# Browse / list pagination
+BROWSE_PAGE_SIZE = int(os.getenv("BROWSE_PAGE_SIZE", "20"))  # Batches per page
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "300"))  # Seconds a rendered page is reused (bounds staleness across replicas)
+
+# Ingestion configuration
+INGEST_FLUSH_DELAY = float(os.getenv("INGEST_FLUSH_DELAY", "1.5"))  # Quiet seconds before buffered /gen files are forwarded
+
+# Job queue configuration
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", "16"))  # Job loops inside the bot process, 0 = only enqueue
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "32"))  # Job loops per `worker` process
+JOB_LEASE = int(os.getenv("JOB_LEASE", "60"))  # Seconds a claimed job stays owned without a heartbeat
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # Seconds an idle worker waits before polling again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))  # Attempts before a job is marked failed
+JOB_RETENTION = 7 * 24 * 3600  # Seconds finished jobs are kept (TTL index)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"  # Owner tag for job leases and the migration lock
+
+# Migration configuration
+MIGRATION_LOCK_LEASE = 60  # Seconds the migration lock is held without a heartbeat
+
+# Persistence configuration
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "10"))  # Seconds between user_data/conversation writes
+
+# Delivery configuration
+COPY_CHUNK_SIZE = 100  # Telegram's copyMessages limit
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))  # RetryAfter retries per chunk
+
+# Outbound rate limiting (shared by the bot and worker processes)
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", "30"))  # Bot API calls per second across all chats and processes
+RATE_SHARE_INTERVAL = float(os.getenv("RATE_SHARE_INTERVAL", "2"))  # Seconds between rate budget rebalances
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # Sustained messages per second to one private chat
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "10"))  # Messages one private chat may get back to back
+
+# Broadcast configuration
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Messages per second, Telegram allows ~30
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))  # Sends in flight at once
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))  # Users per progress checkpoint
+BROADCAST_STATUS_INTERVAL = int(os.getenv("BROADCAST_STATUS_INTERVAL", "15"))  # Seconds between status edits
+
 # Conversation states
 GEN_WAITING_FILES, GEN_WAITING_TITLE, SEARCH_WAITING_INPUT, BROADCAST_WAITING_MESSAGE = range(4)
 
-# Database setup
-client = MongoClient(MONGO_URI)
+# Metrics
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Handler latency", ["handler"])
+TELEGRAM_CALLS = Counter("bot_telegram_api_calls_total", "Telegram Bot API requests", ["method"])
+TELEGRAM_RETRY_AFTER = Counter("bot_telegram_retry_after_total", "Telegram 429 RetryAfter responses", ["method"])
+MONGO_COMMAND_LATENCY = Histogram("bot_mongo_command_seconds", "MongoDB command latency", ["command"])
+MONGO_COMMAND_FAILURES = Counter("bot_mongo_command_failures_total", "Failed MongoDB commands", ["command"])
+FILES_DELIVERED = Counter("bot_files_delivered_total", "Batch files sent to users", ["result"])
+BROADCAST_MESSAGES = Counter("bot_broadcast_messages_total", "Broadcast sends", ["outcome"])
+RATE_LIMITER_WAIT = Histogram("bot_rate_limiter_wait_seconds", "Time outbound calls waited for the rate limiter", ["priority"])
+RATE_LIMITER_RATE = Gauge("bot_rate_limiter_rate", "This process's share of TELEGRAM_RATE, calls per second")
+RATE_LIMITER_PROCESSES = Gauge("bot_rate_limiter_processes", "Live processes sharing TELEGRAM_RATE")
+JOBS = Counter("bot_jobs_total", "Background jobs by type and outcome", ["type", "outcome"])
+ERRORS = Counter("bot_errors_total", "Errors by location, category and exception type", ["where", "category", "exception"])
+
+PERF_WINDOW = 1000  # Latest samples per handler kept for /perf
+latency_samples: Dict[str, deque] = {}
+
+
+def instrument(callback):
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.labels(name).observe(elapsed)
+            latency_samples.setdefault(name, deque(maxlen=PERF_WINDOW)).append(elapsed)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    # Counts every Bot API call and 429 response by method name
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        TELEGRAM_CALLS.labels(api_method).inc()
+        code, payload = await super().do_request(url, method, *args, **kwargs)
+        if code == 429:
+            TELEGRAM_RETRY_AFTER.labels(api_method).inc()
+        return code, payload
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name).inc()
+
+
+def register_runtime_gauges(app):
+    gauges = [
+        ("bot_update_queue_size", "Updates waiting to be processed", lambda: app.update_queue.qsize()),
+        ("bot_page_cache_hits", "Rendered page cache hits", lambda: page_cache.hits),
+        ("bot_page_cache_misses", "Rendered page cache misses", lambda: page_cache.misses),
+        ("bot_batch_cache_batches", "Batches held in the batch cache", lambda: batch_cache.stats()["batches"]),
+        ("bot_batch_cache_files", "File entries held in the batch cache", lambda: batch_cache.stats()["files"]),
+        ("bot_batch_cache_hits", "Batch cache hits", lambda: batch_cache.hits),
+        ("bot_batch_cache_misses", "Batch cache misses", lambda: batch_cache.misses),
+        ("bot_search_index_batches", "Batches in the search index", lambda: len(search_index)),
+        ("bot_rate_limiter_waiting", "Outbound calls queued for a global rate limit token", lambda: rate_limiter.waiting()),
+        ("bot_rate_limiter_chats", "Chats with a per-chat rate limit bucket", lambda: len(rate_limiter.chats)),
+    ]
+    for name, documentation, value in gauges:
+        Gauge(name, documentation).set_function(value)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Logging
+# JSON lines on stdout. Records go through a QueueHandler and are written by a listener thread,
+# so logging never blocks the event loop.
+logger = logging.getLogger("fileshare")
+
+
+class JsonFormatter(logging.Formatter):
+    STANDARD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.STANDARD_FIELDS})
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging() -> QueueListener:
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, stream_handler)
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every request URL (which contains the bot token) at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener.start()
+    return listener
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, RetryAfter):
+        return "flood"
+    if isinstance(error, Forbidden):
+        return "forbidden"
+    if isinstance(error, BadRequest):
+        return "bad_request"
+    if isinstance(error, NetworkError):
+        return "network"
+    if isinstance(error, TelegramError):
+        return "telegram"
+    if isinstance(error, PyMongoError):
+        return "database"
+    return "internal"
+
+
+# What users see when a handler fails; the details only go to the log via log_error
+ERROR_REPLY = "❌ Something went wrong. Please try again later."
+
+
+def log_error(where: str, error: BaseException, exc_info: bool = False, **fields):
+    category = classify_error(error)
+    exception = type(error).__name__
+    ERRORS.labels(where, category, exception).inc()
+    logger.warning(
+        "%s failed: %s", where, error,
+        exc_info=error if exc_info else None,
+        extra={"where": where, "category": category, "exception": exception, **fields}
+    )
+
+
+# Database setup (async driver, so queries never block the bot's event loop)
+client = AsyncMongoClient(MONGO_URI, event_listeners=[MongoCommandTimer()])
 db = client[DB_NAME]
 fsub_channels = db["fsub_channels"]
 admins = db["admins"]
 batches = db["batches"]
+batch_files = db["batch_files"]  # one document per file, ordered by (batch_id, position)
 users = db["users"]
+broadcasts = db["broadcasts"]
+deliveries = db["deliveries"]
+jobs = db["jobs"]
+rate_shares = db["rate_shares"]  # one heartbeat per bot/worker process, for splitting TELEGRAM_RATE
+stored_files = db["files"]  # file_unique_id -> storage channel message, shared across batches
+meta = db["meta"]
+stats = db["stats"]
+stats_daily = db["stats_daily"]
+batch_views_daily = db["batch_views_daily"]
+persisted_user_data = db["user_data"]
+persisted_chat_data = db["chat_data"]
+conversations = db["conversations"]
+
+# Users flagged inactive (blocked the bot, deactivated, chat gone) are skipped by broadcasts and stats.
+# Every user has an explicit inactive flag (migration 9), so this is an equality on the (inactive, _id)
+# index and broadcast pages walk only active users in _id order.
+ACTIVE_USERS = {"inactive": False}
+
+
+# Data Access
+# Handlers only talk to MongoDB through these coroutines.
+def utc_now() -> datetime:
+    # Leases and locks are compared across processes and hosts, so they're stored in UTC, never local time
+    return datetime.now(timezone.utc)
+
+
+async def init_owner():
+    await admins.update_one({"user_id": OWNER_ID}, {"$set": {"user_id": OWNER_ID, "is_owner": True}}, upsert=True)
+
+
+# Schema Migrations
+# Each step runs once; the applied version is stored in meta so restarts cost a single read.
+async def remove_duplicates(collection, field: str):
+    # Unique indexes can't be built while old upsert races left duplicate keys behind
+    pipeline = [
+        {"$group": {"_id": f"${field}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    async for group in await collection.aggregate(pipeline):
+        await collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+
+
+async def migration_1_indexes():
+    for collection, field in ((users, "user_id"), (admins, "user_id"), (fsub_channels, "channel_id")):
+        await remove_duplicates(collection, field)
+        await collection.create_index([(field, ASCENDING)], unique=True)
+    await batches.create_index([("created_at", DESCENDING)])
+    # Serves the active-user filter used by broadcasts (sorted by _id) and dashboard counts
+    await users.create_index([("inactive", ASCENDING), ("_id", ASCENDING)])
+
+
+async def migration_2_stats():
+    await rebuild_stats()
+
+
+async def migration_3_batch_page_index():
+    # Keyset pagination sorts on (created_at, _id); the compound index also covers created_at alone
+    await batches.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    await batches.drop_index([("created_at", DESCENDING)])
+
+
+async def migration_4_batch_views_daily():
+    await batch_views_daily.create_index([("batch_id", ASCENDING), ("day", DESCENDING)], unique=True)
+
+
+async def migration_5_batch_files():
+    # Moves the embedded files arrays into batch_files, leaving only file_count on the batch
+    await batch_files.create_index([("batch_id", ASCENDING), ("position", ASCENDING)], unique=True)
+    async for batch in batches.find({"files": {"$exists": True}}, {"files": 1}):
+        files = batch["files"]
+        await batch_files.delete_many({"batch_id": batch["_id"]})
+        if files:
+            await batch_files.insert_many([
+                {"batch_id": batch["_id"], "position": position, **file_data}
+                for position, file_data in enumerate(files)
+            ])
+        await batches.update_one(
+            {"_id": batch["_id"]},
+            {"$set": {"file_count": len(files)}, "$unset": {"files": ""}}
+        )
+    await rebuild_stats()
+
+
+async def migration_6_conversations():
+    await conversations.create_index([("name", ASCENDING)])
+
+
+async def migration_7_jobs():
+    await jobs.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+    await jobs.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+    await jobs.create_index([("finished_at", ASCENDING)], expireAfterSeconds=JOB_RETENTION)
+    # Broadcasts used to be resumed in-process on startup; they are jobs now
+    async for broadcast in broadcasts.find({"status": "running"}, {"_id": 1}):
+        pending = {"type": "broadcast", "payload.broadcast_id": broadcast["_id"], "status": {"$in": ["queued", "running"]}}
+        if not await jobs.find_one(pending, {"_id": 1}):
+            await enqueue_job("broadcast", {"broadcast_id": broadcast["_id"]})
+
+
+async def migration_8_rate_shares():
+    await rate_shares.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+
+async def migration_9_backfill_inactive():
+    # Users recorded before the flag existed; ACTIVE_USERS only matches an explicit False
+    await users.update_many({"inactive": {"$exists": False}}, {"$set": {"inactive": False}})
+
+
+MIGRATIONS = [
+    (1, migration_1_indexes),
+    (2, migration_2_stats),
+    (3, migration_3_batch_page_index),
+    (4, migration_4_batch_views_daily),
+    (5, migration_5_batch_files),
+    (6, migration_6_conversations),
+    (7, migration_7_jobs),
+    (8, migration_8_rate_shares),
+    (9, migration_9_backfill_inactive),
+]
+
+
+async def get_schema_version() -> int:
+    schema = await meta.find_one({"_id": "schema"}) or {}
+    return schema.get("version", 0)
+
+
+async def acquire_migration_lock() -> bool:
+    # The filter only matches an expired lock; while it's held the upsert collides on _id instead
+    now = utc_now()
+    try:
+        await meta.update_one(
+            {"_id": "migration_lock", "locked_until": {"$lt": now}},
+            {"$set": {"owner": PROCESS_ID, "locked_until": now + timedelta(seconds=MIGRATION_LOCK_LEASE)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def renew_migration_lock():
+    while True:
+        await asyncio.sleep(MIGRATION_LOCK_LEASE / 3)
+        result = await meta.update_one(
+            {"_id": "migration_lock", "owner": PROCESS_ID},
+            {"$set": {"locked_until": utc_now() + timedelta(seconds=MIGRATION_LOCK_LEASE)}}
+        )
+        if not result.matched_count:
+            logger.warning("Migration lock lost", extra={"owner": PROCESS_ID})
+
+
+async def run_migrations():
+    # The bot and every worker call this on startup; one process applies the pending steps under
+    # the lock while the others wait until the stored version catches up
+    latest = MIGRATIONS[-1][0]
+    waiting = False
+    while await get_schema_version() < latest:
+        if await acquire_migration_lock():
+            break
+        if not waiting:
+            logger.info("Waiting for schema migration in another process")
+            waiting = True
+        await asyncio.sleep(1)
+    else:
+        return
+
+    heartbeat = asyncio.create_task(renew_migration_lock())
+    try:
+        current = await get_schema_version()
+        for version, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info("Applying schema migration", extra={"version": version, "migration": migration.__name__})
+            await migration()
+            await meta.update_one(
+                {"_id": "schema"},
+                {"$set": {"version": version, "applied_at": datetime.now()}},
+                upsert=True
+            )
+    finally:
+        heartbeat.cancel()
+        await meta.delete_one({"_id": "migration_lock", "owner": PROCESS_ID})
+
+
+async def get_admins() -> List[Dict]:
+    return await admins.find().to_list(None)
+
+
+async def save_admin(user_id: int):
+    await admins.update_one({"user_id": user_id}, {"$set": {"user_id": user_id, "is_owner": False}}, upsert=True)
+
+
+async def delete_admin(user_id: int) -> bool:
+    result = await admins.delete_one({"user_id": user_id})
+    return result.deleted_count > 0
+
+
+async def load_fsub_channels() -> List[int]:
+    return [channel["channel_id"] async for channel in fsub_channels.find({}, {"channel_id": 1})]
+
+
+async def save_fsub_channel(channel_id: int):
+    await fsub_channels.update_one({"channel_id": channel_id}, {"$set": {"channel_id": channel_id}}, upsert=True)
+
+
+async def delete_fsub_channel(channel_id: int) -> bool:
+    result = await fsub_channels.delete_one({"channel_id": channel_id})
+    return result.deleted_count > 0
+
+
+recently_seen: Dict[int, float] = {}  # user_id -> monotonic time of the last write
+MAX_RECENTLY_SEEN = 100000
+
+
+async def record_user(user) -> bool:
+    # Upserts the user in one round trip and returns True if they weren't in the database before
+    now = time.monotonic()
+    seen = recently_seen.get(user.id)
+    if seen and now - seen < LAST_ACTIVE_INTERVAL:
+        # A broadcast (possibly in a worker process) may have flagged them inactive since the last
+        # write; coming back with /start must put them back on the broadcast list
+        await reactivate_user(user.id)
+        return False
+
+    try:
+        previous = await users.find_one_and_update(
+            {"user_id": user.id},
+            {
+                "$set": {
+                    "username": user.username,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "last_active": datetime.now(),
+                    "inactive": False
+                },
+                "$setOnInsert": {"joined_at": datetime.now()}
+            },
+            projection={"_id": 1, "inactive": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent /start from the same user won the upsert
+        previous = {}
+
+    if previous is None:
+        await bump_stats({"users": 1}, {"new_users": 1})
+    elif previous.get("inactive"):
+        await bump_stats({"inactive_users": -1})
+
+    if len(recently_seen) >= MAX_RECENTLY_SEEN:
+        recently_seen.clear()
+    recently_seen[user.id] = now
+    return previous is None
+
+
+async def reactivate_user(user_id: int):
+    # A no-op indexed update unless the user is currently flagged inactive
+    result = await users.update_one({"user_id": user_id, "inactive": True}, {"$set": {"inactive": False}})
+    if result.modified_count:
+        await bump_stats({"inactive_users": -1})
+
+
+async def count_users() -> int:
+    counters = await stats.find_one({"_id": "global"}, {"users": 1}) or {}
+    return counters.get("users", 0)
+
+
+async def count_active_users() -> int:
+    return await users.count_documents(ACTIVE_USERS)
+
+
+async def mark_users_inactive(dead_users: Dict[str, List[int]]):
+    # dead_users maps an inactive reason to the user_ids that failed with it
+    requests = [
+        UpdateMany(
+            {"user_id": {"$in": user_ids}, "inactive": {"$ne": True}},
+            {"$set": {"inactive": True, "inactive_reason": reason}}
+        )
+        for reason, user_ids in dead_users.items() if user_ids
+    ]
+    if requests:
+        result = await users.bulk_write(requests, ordered=False)
+        await bump_stats({"inactive_users": result.modified_count})
+
+
+async def iter_user_ids(after_id: Optional[ObjectId] = None):
+    # Streams (_id, user_id) in _id order so a broadcast can resume after its last checkpoint
+    query = dict(ACTIVE_USERS)
+    if after_id:
+        query["_id"] = {"$gt": after_id}
+    async for user in users.find(query, {"user_id": 1}).sort("_id", 1).batch_size(BROADCAST_PAGE_SIZE):
+        yield user
+
+
+async def save_delivery(delivery: Dict) -> ObjectId:
+    result = await deliveries.insert_one(delivery)
+    return result.inserted_id
+
+
+async def get_delivery(delivery_id: str, user_id: int) -> Optional[Dict]:
+    return await deliveries.find_one({"_id": ObjectId(delivery_id), "user_id": user_id})
+
+
+async def update_delivery(delivery_id: ObjectId, fields: Dict):
+    await deliveries.update_one({"_id": delivery_id}, {"$set": fields})
+
+
+async def create_broadcast(broadcast_data: Dict) -> ObjectId:
+    result = await broadcasts.insert_one(broadcast_data)
+    return result.inserted_id
+
+
+async def update_broadcast(broadcast_id: ObjectId, fields: Dict):
+    fields["updated_at"] = datetime.now()
+    await broadcasts.update_one({"_id": broadcast_id}, {"$set": fields})
+
+
+async def get_broadcast(broadcast_id: ObjectId) -> Optional[Dict]:
+    return await broadcasts.find_one({"_id": broadcast_id})
+
+
+# Jobs
+# Deliveries and broadcasts run off the jobs collection. A worker claims a job atomically and holds it
+# with a lease it keeps renewing; a job whose lease runs out (crashed worker) is claimed again.
+jobs_available = asyncio.Event()  # Wakes this process's idle workers right after a local enqueue
+
+
+async def enqueue_job(job_type: str, payload: Dict) -> ObjectId:
+    now = utc_now()
+    result = await jobs.insert_one({
+        "type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "run_at": now,
+        "created_at": now
+    })
+    jobs_available.set()
+    return result.inserted_id
+
+
+async def claim_job(worker_id: str) -> Optional[Dict]:
+    now = utc_now()
+    return await jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            # Jobs that keep killing their worker are left running for inspection
+            {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": JOB_MAX_ATTEMPTS}}
+        ]},
+        {"$set": {"status": "running", "worker": worker_id, "lease_until": now + timedelta(seconds=JOB_LEASE)},
+         "$inc": {"attempts": 1}},
+        sort=[("run_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def save_job_progress(job_id: ObjectId, worker_id: str, progress: Dict) -> bool:
+    # False once another worker owns the job
+    result = await jobs.update_one(
+        {"_id": job_id, "status": "running", "worker": worker_id},
+        {"$set": {"progress": progress}}
+    )
+    return result.matched_count > 0
+
+
+async def renew_job_lease(job_id: ObjectId, worker_id: str) -> bool:
+    result = await jobs.update_one(
+        {"_id": job_id, "status": "running", "worker": worker_id},
+        {"$set": {"lease_until": utc_now() + timedelta(seconds=JOB_LEASE)}}
+    )
+    return result.matched_count > 0
+
+
+async def finish_job(job_id: ObjectId, worker_id: str):
+    await jobs.update_one(
+        {"_id": job_id, "worker": worker_id},
+        {"$set": {"status": "done", "finished_at": utc_now()}, "$unset": {"lease_until": ""}}
+    )
+
+
+async def fail_job(job: Dict, worker_id: str, error: Exception):
+    fields = {"error": f"{type(error).__name__}: {error}"}
+    if job["attempts"] >= JOB_MAX_ATTEMPTS:
+        fields.update(status="failed", finished_at=utc_now())
+    else:
+        # Exponential backoff, capped at five minutes
+        fields.update(status="queued", run_at=utc_now() + timedelta(seconds=min(2 ** job["attempts"], 300)))
+    await jobs.update_one({"_id": job["_id"], "worker": worker_id}, {"$set": fields, "$unset": {"lease_until": ""}})
+
+
+async def release_job(job_id: ObjectId, worker_id: str):
+    # Hands a job back on shutdown without counting it as an attempt
+    await jobs.update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {"$set": {"status": "queued", "run_at": utc_now()}, "$unset": {"lease_until": ""}, "$inc": {"attempts": -1}}
+    )
+
+
+async def find_stored_files(file_unique_ids: List[str]) -> Dict[str, Dict]:
+    if not file_unique_ids:
+        return {}
+    return {
+        stored["_id"]: stored
+        async for stored in stored_files.find({"_id": {"$in": file_unique_ids}}, {"message_id": 1})
+    }
+
+
+async def register_stored_files(files: List[Dict]):
+    # First writer wins, a file forwarded twice concurrently just keeps its own extra copy
+    requests = [
+        UpdateOne(
+            {"_id": file_data["file_unique_id"]},
+            {"$setOnInsert": {
+                "message_id": file_data["message_id"],
+                "type": file_data["type"],
+                "size": file_data["size"],
+                "refs": 0,
+                "created_at": datetime.now()
+            }},
+            upsert=True
+        )
+        for file_data in files if file_data.get("file_unique_id")
+    ]
+    if requests:
+        await stored_files.bulk_write(requests, ordered=False)
+
+
+async def update_file_refs(files: List[Dict], delta: int):
+    # Stored files stay in the channel at zero refs so a later /gen can still reuse them
+    refs = {}
+    for file_data in files:
+        if file_data.get("file_unique_id"):
+            refs[file_data["file_unique_id"]] = refs.get(file_data["file_unique_id"], 0) + delta
+    if refs:
+        await stored_files.bulk_write(
+            [UpdateOne({"_id": file_unique_id}, {"$inc": {"refs": count}}) for file_unique_id, count in refs.items()],
+            ordered=False
+        )
+
+
+async def create_batch(batch_data: Dict, files: List[Dict]) -> str:
+    # Files go in first so a batch is never visible without them
+    batch_oid = ObjectId()
+    if files:
+        await batch_files.insert_many([
+            {"batch_id": batch_oid, "position": position, **file_data}
+            for position, file_data in enumerate(files)
+        ])
+    await batches.insert_one({"_id": batch_oid, **batch_data, "file_count": len(files)})
+    await update_file_refs(files, 1)
+    await bump_stats({"batches": 1, "files": len(files)})
+    search_index.add(str(batch_oid), batch_data["title"], 0)
+    page_cache.invalidate()
+    return str(batch_oid)
+
+
+async def get_batch(batch_id: str) -> Optional[Dict]:
+    # Raises bson.errors.InvalidId for malformed ids so callers can tell bad links apart
+    return await batches.find_one({"_id": ObjectId(batch_id)})
+
+
+async def iter_batch_message_ids(batch_oid: ObjectId, start: int = 0):
+    # Streams storage message_ids in upload order straight off the (batch_id, position) index
+    cursor = batch_files.find({"batch_id": batch_oid, "position": {"$gte": start}}, {"_id": 0, "message_id": 1}) \
+        .sort("position", ASCENDING) \
+        .batch_size(COPY_CHUNK_SIZE)
+    async for file_data in cursor:
+        yield file_data["message_id"]
+
+
+async def get_cached_batch(batch_id: str) -> Optional[Dict]:
+    # Delivery path: title + message_ids, served from the LRU cache when possible. Batches too big for
+    # the cache come back without message_ids and are streamed from batch_files at delivery time.
+    batch = batch_cache.get(batch_id)
+    if batch is None:
+        batch = await batches.find_one({"_id": ObjectId(batch_id)}, {"title": 1, "file_count": 1})
+        if batch and batch.get("file_count", 0) <= batch_cache.max_files:
+            batch["message_ids"] = [message_id async for message_id in iter_batch_message_ids(batch["_id"])]
+            batch_cache.put(batch_id, batch)
+    return batch
+
+
+async def get_batch_page(cursor: Optional[tuple], older: bool, limit: int) -> List[Dict]:
+    # Keyset pagination on (created_at, _id), newest first. Fetches up to limit + 1 so callers can
+    # tell whether another page exists. Only _id/title/created_at are transferred.
+    query = {}
+    if cursor:
+        created_at, batch_oid = cursor
+        op = "$lt" if older else "$gt"
+        query = {"$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: batch_oid}}
+        ]}
+    direction = DESCENDING if older else ASCENDING
+    return await batches.find(query, {"title": 1, "created_at": 1}) \
+        .sort([("created_at", direction), ("_id", direction)]) \
+        .limit(limit + 1) \
+        .to_list(None)
+
+
+async def iter_batch_titles():
+    async for batch in batches.find({}, {"title": 1, "views": 1}):
+        yield batch
+
+
+async def rename_batch(batch_id: str, new_title: str) -> bool:
+    result = await batches.update_one({"_id": ObjectId(batch_id)}, {"$set": {"title": new_title}})
+    if result.modified_count > 0:
+        search_index.rename(batch_id, new_title)
+        page_cache.invalidate()
+        batch_cache.invalidate(batch_id)
+    return result.modified_count > 0
+
+
+async def delete_batch(batch_id: str) -> bool:
+    deleted = await batches.find_one_and_delete({"_id": ObjectId(batch_id)}, projection={"file_count": 1})
+    if not deleted:
+        return False
+    files = await batch_files.find({"batch_id": deleted["_id"]}, {"_id": 0, "file_unique_id": 1}).to_list(None)
+    await batch_files.delete_many({"batch_id": deleted["_id"]})
+    await update_file_refs(files, -1)
+    search_index.remove(batch_id)
+    page_cache.invalidate()
+    batch_cache.invalidate(batch_id)
+    await batch_views_daily.delete_many({"batch_id": deleted["_id"]})
+    await bump_stats({"batches": -1, "files": -deleted.get("file_count", 0)})
+    return True
+
+
+# A view flush is three independent writes. ViewCounter retries each one on its own, so a failure in
+# one never re-applies the increments the others already wrote.
+async def inc_batch_views(increments: Dict[ObjectId, int]):
+    await batches.bulk_write(
+        [UpdateOne({"_id": batch_oid}, {"$inc": {"views": count}}) for batch_oid, count in increments.items()],
+        ordered=False
+    )
+
+
+async def inc_daily_views(increments: Dict[tuple, int]):
+    # Keyed by (batch_oid, day) so a write retried after midnight still lands on the day it was counted
+    await batch_views_daily.bulk_write(
+        [
+            UpdateOne({"batch_id": batch_oid, "day": day}, {"$inc": {"views": count}}, upsert=True)
+            for (batch_oid, day), count in increments.items()
+        ],
+        ordered=False
+    )
+
+
+async def inc_view_stats(increments: Dict[str, int]):
+    await bump_stats({"views": increments["views"]}, {"deliveries": increments["views"]})
 
-# Initialize owner as admin
-admins.update_one({"user_id": OWNER_ID}, {"$set": {"user_id": OWNER_ID, "is_owner": True}}, upsert=True)
+
+VIEW_WRITES = {"batches": inc_batch_views, "daily": inc_daily_views, "stats": inc_view_stats}
+
+
+async def get_daily_views(batch_id: str, days: int = 7) -> List[Dict]:
+    return await batch_views_daily.find({"batch_id": ObjectId(batch_id)}) \
+        .sort("day", DESCENDING) \
+        .limit(days) \
+        .to_list(None)
+
+
+# Statistics
+# Running counters live in a single stats document; stats_daily holds one document per day.
+def today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+async def bump_stats(counters: Dict[str, int], daily: Optional[Dict[str, int]] = None):
+    await stats.update_one({"_id": "global"}, {"$inc": counters}, upsert=True)
+    if daily:
+        await stats_daily.update_one({"_id": today()}, {"$inc": daily}, upsert=True)
+
+
+async def rebuild_stats() -> Dict:
+    # Recomputes the counters server-side from the source collections (views/deliveries history is kept)
+    pipeline = [{"$group": {
+        "_id": None,
+        "batches": {"$sum": 1},
+        "views": {"$sum": {"$ifNull": ["$views", 0]}}
+    }}]
+    totals = {"batches": 0, "views": 0}
+    async for row in await batches.aggregate(pipeline):
+        totals = {key: row[key] for key in totals}
+
+    totals["files"] = await batch_files.count_documents({})
+
+    totals["users"] = await users.count_documents({})
+    totals["inactive_users"] = await users.count_documents({"inactive": True})
+    totals["rebuilt_at"] = datetime.now()
+    await stats.update_one({"_id": "global"}, {"$set": totals}, upsert=True)
+    return totals
+
+
+async def get_stats(days: int = 7) -> Dict:
+    counters, daily = await asyncio.gather(
+        stats.find_one({"_id": "global"}),
+        stats_daily.find().sort("_id", DESCENDING).limit(days).to_list(None)
+    )
+    counters = counters or {}
+    return {
+        "users": counters.get("users", 0),
+        "active_users": counters.get("users", 0) - counters.get("inactive_users", 0),
+        "batches": counters.get("batches", 0),
+        "files": counters.get("files", 0),
+        "views": counters.get("views", 0),
+        "fsub": len(settings_cache.fsub_channels),
+        "admins": len(settings_cache.admin_ids),
+        "daily": daily,
+    }
 
 
 # Helper Functions
@@ -35,24 +897,131 @@ def is_owner(user_id: int) -> bool:
     return user_id == OWNER_ID
 
 
+class SettingsCache:
+    # In-memory copy of the admins and fsub_channels collections, so permission checks never hit MongoDB
+    def __init__(self):
+        self.admin_ids = set()
+        self.fsub_channels: List[int] = []
+
+    async def load(self):
+        self.admin_ids = {admin["user_id"] for admin in await get_admins()}
+        self.fsub_channels = await load_fsub_channels()
+
+    async def refresh_periodically(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as e:
+                log_error("settings_cache_refresh", e)
+
+    async def watch_changes(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": [admins.name, fsub_channels.name]}}}]
+        while True:
+            try:
+                async with await db.watch(pipeline) as stream:
+                    async for _ in stream:
+                        await self.load()
+            except Exception as e:
+                log_error("settings_change_stream", e)
+                await asyncio.sleep(5)
+
+
+settings_cache = SettingsCache()
+
+
 def is_admin(user_id: int) -> bool:
-    return admins.find_one({"user_id": user_id}) is not None
+    return user_id == OWNER_ID or user_id in settings_cache.admin_ids
 
 
 def get_fsub_channels() -> List[int]:
-    return [channel["channel_id"] for channel in fsub_channels.find()]
+    return list(settings_cache.fsub_channels)
 
 
-async def check_fsub(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    channels = get_fsub_channels()
-    for channel_id in channels:
+class FSubChecker:
+    JOINED_STATUSES = ("member", "administrator", "creator")
+    MAX_MEMBER_ENTRIES = 100000
+
+    def __init__(self, member_ttl: int, info_ttl: int, check_timeout: float = 5, fail_open: bool = False):
+        self.member_ttl = member_ttl
+        self.info_ttl = info_ttl
+        self.check_timeout = check_timeout
+        self.fail_open = fail_open
+        self._members: Dict[tuple, float] = {}  # (user_id, channel_id) -> expiry, positive results only
+        self._channel_info: Dict[int, tuple] = {}  # channel_id -> (title, invite_link, expiry)
+
+    async def is_member(self, bot, channel_id: int, user_id: int) -> bool:
+        key = (user_id, channel_id)
+        expires = self._members.get(key)
+        if expires and expires > time.monotonic():
+            return True
+
+        # One bounded attempt: this runs inside /start, so flood waits aren't sat out here
         try:
-            member = await context.bot.get_chat_member(channel_id, user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                return False
-        except Exception:
-            continue
-    return True
+            member = await asyncio.wait_for(bot.get_chat_member(channel_id, user_id), self.check_timeout)
+        except (BadRequest, Forbidden):
+            # The user (or the channel) isn't visible to the bot, so membership can't be confirmed
+            return False
+        except (TelegramError, asyncio.TimeoutError) as e:
+            # Flood waits, timeouts and network errors say nothing about membership; FSUB_FAIL_OPEN
+            # decides the answer, which is never cached
+            log_error("fsub_member_check", e, channel_id=channel_id, user_id=user_id, fail_open=self.fail_open)
+            return self.fail_open
+
+        if member.status not in self.JOINED_STATUSES:
+            self._members.pop(key, None)
+            return False
+
+        if len(self._members) >= self.MAX_MEMBER_ENTRIES:
+            self._prune()
+        self._members[key] = time.monotonic() + self.member_ttl
+        return True
+
+    async def not_joined(self, bot, user_id: int) -> List[int]:
+        channels = get_fsub_channels()
+        results = await asyncio.gather(*(self.is_member(bot, ch_id, user_id) for ch_id in channels))
+        return [ch_id for ch_id, joined in zip(channels, results) if not joined]
+
+    async def get_channel_info(self, bot, channel_id: int) -> Optional[tuple]:
+        cached = self._channel_info.get(channel_id)
+        if cached and cached[2] > time.monotonic():
+            return cached
+
+        try:
+            chat = await bot.get_chat(channel_id)
+            # Reuse the channel's primary link so it isn't rotated on every request
+            invite_link = f"https://t.me/{chat.username}" if chat.username else chat.invite_link
+            if not invite_link:
+                invite_link = await bot.export_chat_invite_link(channel_id)
+        except Exception as e:
+            log_error("fsub_channel_info", e, channel_id=channel_id)
+            return None
+
+        cached = (chat.title, invite_link, time.monotonic() + self.info_ttl)
+        self._channel_info[channel_id] = cached
+        return cached
+
+    async def join_keyboard(self, bot, channel_ids: List[int], callback_data: str) -> InlineKeyboardMarkup:
+        infos = await asyncio.gather(*(self.get_channel_info(bot, ch_id) for ch_id in channel_ids))
+        keyboard = [
+            [InlineKeyboardButton(f"Join {title}", url=invite_link)]
+            for title, invite_link, _ in filter(None, infos)
+        ]
+        keyboard.append([InlineKeyboardButton("✅ I Joined All", callback_data=callback_data)])
+        return InlineKeyboardMarkup(keyboard)
+
+    def forget_channel(self, channel_id: int):
+        self._channel_info.pop(channel_id, None)
+        self._members = {key: exp for key, exp in self._members.items() if key[1] != channel_id}
+
+    def _prune(self):
+        now = time.monotonic()
+        self._members = {key: exp for key, exp in self._members.items() if exp > now}
+        if len(self._members) >= self.MAX_MEMBER_ENTRIES:
+            self._members.clear()
+
+
+fsub_checker = FSubChecker(FSUB_MEMBER_TTL, FSUB_CHANNEL_INFO_TTL, FSUB_CHECK_TIMEOUT, FSUB_FAIL_OPEN)
 
 
 BOT_USERNAME = None
@@ -71,6 +1040,1218 @@ def get_main_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+# Batch Cache
+class BatchCache:
+    # LRU + TTL cache of batch documents, bounded by the total number of message_ids it holds
+    def __init__(self, max_files: int, ttl: int):
+        self.max_files = max_files
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # batch_id -> (batch, expiry)
+        self._files = 0
+
+    def get(self, batch_id: str) -> Optional[Dict]:
+        entry = self._entries.get(batch_id)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                self.invalidate(batch_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(batch_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, batch_id: str, batch: Dict):
+        size = len(batch.get("message_ids", []))
+        if size > self.max_files:
+            return
+        self.invalidate(batch_id)
+        while self._entries and self._files + size > self.max_files:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._files -= len(evicted.get("message_ids", []))
+        self._entries[batch_id] = (batch, time.monotonic() + self.ttl)
+        self._files += size
+
+    def invalidate(self, batch_id: str):
+        entry = self._entries.pop(batch_id, None)
+        if entry is not None:
+            self._files -= len(entry[0].get("message_ids", []))
+
+    def stats(self) -> Dict:
+        return {"batches": len(self._entries), "files": self._files, "hits": self.hits, "misses": self.misses}
+
+
+batch_cache = BatchCache(BATCH_CACHE_MAX_FILES, BATCH_CACHE_TTL)
+
+
+# View Counting
+class ViewCounter:
+    # Buffers view increments in memory and writes them as one bulk_write per VIEW_WRITES step. Each
+    # step's increments stay queued until that step succeeds; a partial bulk_write keeps only the
+    # writes it reported as failed.
+    def __init__(self):
+        self._pending: Dict[ObjectId, int] = {}
+        self._unwritten: Dict[str, Dict] = {}  # VIEW_WRITES step -> increments it still has to write
+
+    def add(self, batch_oid: ObjectId):
+        self._pending[batch_oid] = self._pending.get(batch_oid, 0) + 1
+
+    def pending(self, batch_oid: ObjectId) -> int:
+        return self._pending.get(batch_oid, 0) + self._unwritten.get("batches", {}).get(batch_oid, 0)
+
+    def _queue(self, step: str, increments: Dict):
+        queued = self._unwritten.setdefault(step, {})
+        for key, count in increments.items():
+            queued[key] = queued.get(key, 0) + count
+
+    async def flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, {}
+            self._queue("batches", pending)
+            if VIEW_DAILY_BUCKETS:
+                day = today()
+                self._queue("daily", {(batch_oid, day): count for batch_oid, count in pending.items()})
+            self._queue("stats", {"views": sum(pending.values())})
+
+        for step in list(self._unwritten):
+            increments = self._unwritten.pop(step)
+            try:
+                await VIEW_WRITES[step](increments)
+            except BulkWriteError as e:
+                keys = list(increments)
+                failed = {keys[error["index"]]: increments[keys[error["index"]]] for error in e.details["writeErrors"]}
+                log_error("view_flush", e, step=step, failed=len(failed))
+                self._queue(step, failed)
+            except asyncio.CancelledError:
+                # Shutdown mid-write; the final flush in post_shutdown picks it up
+                self._queue(step, increments)
+                raise
+            except Exception as e:
+                log_error("view_flush", e, step=step, writes=len(increments))
+                self._queue(step, increments)
+
+    async def run(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+view_counter = ViewCounter()
+
+
+# Batch Search
+# In-memory inverted index over batch titles. Every query word must match a title word or word prefix;
+# results are ranked by how many words matched exactly, then by views.
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class SearchIndex:
+    def __init__(self):
+        self._titles: Dict[str, str] = {}  # batch_id -> title
+        self._views: Dict[str, int] = {}
+        self._postings: Dict[str, set] = {}  # token -> batch_ids
+        self._vocabulary: List[str] = []  # sorted tokens, for prefix lookups
+
+    async def load(self):
+        index = SearchIndex()
+        async for batch in iter_batch_titles():
+            index.add(str(batch["_id"]), batch.get("title", ""), batch.get("views", 0))
+        self.__dict__.update(index.__dict__)
+
+    async def refresh_periodically(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as e:
+                log_error("search_index_refresh", e)
+
+    def add(self, batch_id: str, title: str, views: int = 0):
+        self._titles[batch_id] = title
+        self._views[batch_id] = views
+        for token in set(tokenize(title)):
+            if token not in self._postings:
+                self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            self._postings[token].add(batch_id)
+
+    def remove(self, batch_id: str):
+        title = self._titles.pop(batch_id, None)
+        self._views.pop(batch_id, None)
+        if title is None:
+            return
+        for token in set(tokenize(title)):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(batch_id)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def rename(self, batch_id: str, title: str):
+        views = self._views.get(batch_id, 0)
+        self.remove(batch_id)
+        self.add(batch_id, title, views)
+
+    def _match(self, term: str) -> Dict[str, int]:
+        # batch_id -> 2 for an exact word match, 1 for a prefix match
+        matches = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            weight = 2 if token == term else 1
+            for batch_id in self._postings[token]:
+                matches[batch_id] = max(matches.get(batch_id, 0), weight)
+        return matches
+
+    def search(self, query_text: str) -> List[tuple]:
+        scores = None
+        for term in set(tokenize(query_text)):
+            matches = self._match(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {batch_id: score + matches[batch_id] for batch_id, score in scores.items() if batch_id in matches}
+            if not scores:
+                return []
+        if not scores:
+            return []
+
+        ranked = sorted(
+            scores,
+            key=lambda batch_id: (scores[batch_id] + math.log1p(self._views.get(batch_id, 0)) / 10),
+            reverse=True
+        )
+        return [(batch_id, self._titles[batch_id]) for batch_id in ranked]
+
+    def __len__(self):
+        return len(self._titles)
+
+
+search_index = SearchIndex()
+
+
+def search_results_page(query_text: str, page: int) -> tuple:
+    results = search_index.search(query_text)
+    if not results:
+        return None, None
+
+    pages = math.ceil(len(results) / SEARCH_PAGE_SIZE)
+    page = max(0, min(page, pages - 1))
+    start = page * SEARCH_PAGE_SIZE
+
+    keyboard = [
+        [InlineKeyboardButton(f"📦 {title}", callback_data=f"user_batch_{batch_id}")]
+        for batch_id, title in results[start:start + SEARCH_PAGE_SIZE]
+    ]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"search_page_{page - 1}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_page_{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+
+    text = (
+        f"🔍 <b>Search Results for '{html.escape(query_text)}':</b>\n"
+        f"{len(results)} found · page {page + 1}/{pages}"
+    )
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+# Batch Pages
+# Shared by Browse (user view) and /list (admin view). Callback data is
+# page_<view>_<n|p>_<cursor>, where the cursor is "<created_at ms in base36>-<ObjectId>" (under 64 bytes).
+USER_VIEW = "u"
+ADMIN_VIEW = "a"
+PAGE_VIEWS = {
+    USER_VIEW: ("📂 <b>Browse Files:</b>", "📋 No files available yet.", "user_batch_"),
+    ADMIN_VIEW: ("📋 <b>All Batches:</b>", "📋 No batches found.", "batch_view_"),
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+def base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def encode_page_cursor(batch: Dict) -> str:
+    millis = (batch["created_at"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{base36(millis)}-{batch['_id']}"
+
+
+def decode_page_cursor(cursor: str) -> Optional[tuple]:
+    if not cursor:
+        return None
+    millis, batch_oid = cursor.split("-")
+    return EPOCH + timedelta(milliseconds=int(millis, 36)), ObjectId(batch_oid)
+
+
+class PageCache:
+    # Rendered (text, keyboard) pairs keyed by (view, cursor, direction); cleared whenever the catalogue changes
+    MAX_PAGES = 1000
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._pages: Dict[tuple, tuple] = {}
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        entry = self._pages.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: tuple, page: tuple):
+        if len(self._pages) >= self.MAX_PAGES:
+            self._pages.clear()
+        self._pages[key] = (page, time.monotonic() + self.ttl)
+
+    def invalidate(self):
+        self._pages.clear()
+
+
+page_cache = PageCache(PAGE_CACHE_TTL)
+
+
+async def render_batch_page(view: str, cursor: str = "", older: bool = True) -> tuple:
+    key = (view, cursor, older)
+    page = page_cache.get(key)
+    if page is None:
+        page = await build_batch_page(view, cursor, older)
+        page_cache.set(key, page)
+    return page
+
+
+async def build_batch_page(view: str, cursor: str, older: bool) -> tuple:
+    header, empty_text, item_prefix = PAGE_VIEWS[view]
+    batch_list = await get_batch_page(decode_page_cursor(cursor), older, BROWSE_PAGE_SIZE)
+    has_more = len(batch_list) > BROWSE_PAGE_SIZE
+    batch_list = batch_list[:BROWSE_PAGE_SIZE]
+
+    if older:
+        has_older, has_newer = has_more, bool(cursor)
+    else:
+        if not has_more:
+            # Walked back to the newest batches, show the regular first page
+            return await render_batch_page(view)
+        batch_list.reverse()
+        has_older, has_newer = True, True
+
+    if not batch_list:
+        return empty_text, None
+
+    keyboard = [
+        [InlineKeyboardButton(f"📦 {batch['title']}", callback_data=f"{item_prefix}{batch['_id']}")]
+        for batch in batch_list
+    ]
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"page_{view}_p_{encode_page_cursor(batch_list[0])}"))
+    if has_older:
+        nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"page_{view}_n_{encode_page_cursor(batch_list[-1])}"))
+    if nav:
+        keyboard.append(nav)
+
+    return header, InlineKeyboardMarkup(keyboard)
+
+
+# Rate Limiting
+# Every Bot API call goes through rate_limiter (Application.builder().rate_limiter). Calls wait for a
+# token from one global budget, handed out by priority, so a running broadcast can't starve user
+# deliveries. Messages to a chat also draw from that chat's own bucket. rate_share splits the
+# bot-wide budget between the processes sharing the database, see RateShare.
+PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_BROADCAST = range(3)
+PRIORITY_NAMES = ("interactive", "background", "broadcast")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def full(self) -> bool:
+        return self._tokens + (time.monotonic() - self._updated) * self.rate >= self.capacity
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    # rate_limit_args is the call's priority; calls made without it are interactive
+    MESSAGE_ENDPOINTS = ("send", "copy", "forward")
+    GROUP_RATE, GROUP_BURST = 20 / 60, 20  # Telegram allows about 20 messages a minute in a group
+    MAX_CHATS = 100000
+
+    def __init__(self, rate: float, chat_rate: float, chat_burst: int, unlimited_chats=()):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # Chats only capped by the global budget, e.g. the storage channel /gen forwards every file into
+        self.unlimited_chats = {str(chat_id) for chat_id in unlimited_chats}
+        self.chats: Dict[object, TokenBucket] = {}
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._demand: Optional[int] = None  # Most urgent priority requested since the last take_demand()
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        self._start()
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        # Let anything still queued through rather than leave it hanging
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_result(None)
+        self._waiters = []
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def set_rate(self, rate: float):
+        self.rate = rate
+        self._tokens = min(self._tokens, rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def take_demand(self) -> Optional[int]:
+        # Most urgent priority asked for since the last call, including calls still queued; None when idle
+        demand = self._demand
+        if self._waiters:
+            demand = self._waiters[0][0] if demand is None else min(demand, self._waiters[0][0])
+        self._demand = None
+        return demand
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # Caller was cancelled while waiting
+            self._tokens -= 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: int):
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._demand = priority if self._demand is None else min(self._demand, priority)
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self.MAX_CHATS:
+                # A full bucket holds no state worth keeping
+                self.chats = {key: value for key, value in self.chats.items() if not value.full()}
+            if str(chat_id).startswith(("-", "@")):
+                bucket = TokenBucket(self.GROUP_RATE, self.GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = PRIORITY_INTERACTIVE if rate_limit_args is None else rate_limit_args
+        started = time.monotonic()
+        chat_id = data.get("chat_id")
+        if chat_id is not None and endpoint.startswith(self.MESSAGE_ENDPOINTS) and str(chat_id) not in self.unlimited_chats:
+            await self._chat_bucket(chat_id).acquire()
+        await self._acquire(priority)
+        RATE_LIMITER_WAIT.labels(PRIORITY_NAMES[priority]).observe(time.monotonic() - started)
+
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            # Telegram's flood wait applies to the whole bot, so hold every queued call, then let the caller retry
+            self.pause(retry_after_seconds(e))
+            raise
+
+
+class RateShare:
+    # Telegram's limits are per bot, not per process. Every RATE_SHARE_INTERVAL each process upserts
+    # its heartbeat (most urgent recent priority, flood-wait deadline) into rate_shares and sets its
+    # limiter to a weighted slice of TELEGRAM_RATE over the live heartbeats. Processes serving users
+    # outweigh ones only broadcasting, and a RetryAfter seen by one process pauses all of them.
+    WEIGHTS = {PRIORITY_INTERACTIVE: 4, PRIORITY_BACKGROUND: 2, PRIORITY_BROADCAST: 1, None: 0.25}
+
+    def __init__(self, limiter: PriorityRateLimiter, rate: float, interval: float):
+        self.limiter = limiter
+        self.rate = rate
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def sync(self):
+        now = utc_now()
+        demand = self.limiter.take_demand()
+        await rate_shares.update_one(
+            {"_id": PROCESS_ID},
+            {"$set": {
+                "demand": demand,
+                "paused_until": now + timedelta(seconds=self.limiter.paused_for()),
+                "expires_at": now + timedelta(seconds=self.interval * 3)
+            }},
+            upsert=True
+        )
+        live = await rate_shares.find({"expires_at": {"$gt": now}}).to_list(None)
+        total = sum(self.WEIGHTS.get(share.get("demand"), 1) for share in live) or 1
+        self.limiter.set_rate(self.rate * self.WEIGHTS[demand] / total)
+        # The client hands back naive UTC datetimes
+        paused_until = max((share["paused_until"].replace(tzinfo=timezone.utc) for share in live), default=now)
+        if paused_until > now:
+            self.limiter.pause((paused_until - now).total_seconds())
+        RATE_LIMITER_RATE.set(self.limiter.rate)
+        RATE_LIMITER_PROCESSES.set(len(live))
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync()
+            except PyMongoError as e:
+                # Keep the last share; the heartbeat expires on its own if this process is gone for good
+                log_error("rate_share", e)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        # The first share is in place before any job or update is handled
+        try:
+            await self.sync()
+        except PyMongoError as e:
+            log_error("rate_share", e)
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await rate_shares.delete_one({"_id": PROCESS_ID})
+        except PyMongoError as e:
+            log_error("rate_share", e)
+
+
+rate_limiter = PriorityRateLimiter(TELEGRAM_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, unlimited_chats=(STORAGE_CHANNEL_ID,))
+rate_share = RateShare(rate_limiter, TELEGRAM_RATE, RATE_SHARE_INTERVAL)
+
+
+# File Delivery
+def retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+async def call_with_retry(request):
+    # request is a zero-argument coroutine factory, re-invoked after each RetryAfter
+    for attempt in range(DELIVERY_MAX_RETRIES + 1):
+        try:
+            return await request()
+        except RetryAfter as e:
+            if attempt == DELIVERY_MAX_RETRIES:
+                raise
+            await asyncio.sleep(retry_after_seconds(e) + attempt)
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+async def chunk_message_ids(message_ids):
+    # copyMessages needs strictly increasing ids, so a chunk also ends wherever the order drops.
+    # message_ids is an async iterator, so a batch_files cursor is consumed one chunk at a time.
+    chunk = []
+    async for message_id in message_ids:
+        if chunk and (len(chunk) >= COPY_CHUNK_SIZE or message_id <= chunk[-1]):
+            yield chunk
+            chunk = []
+        chunk.append(message_id)
+    if chunk:
+        yield chunk
+
+
+def is_chat_error(error: Exception) -> bool:
+    # Blocked, deactivated or missing chats: nothing else will get through to this chat either
+    return classify_send_error(error) != "failed"
+
+
+async def copy_chunk(bot, chat_id: int, chunk: List[int], result: Dict) -> bool:
+    # Returns False once the chat itself can't receive messages
+    try:
+        copied = await call_with_retry(lambda: bot.copy_messages(
+            chat_id=chat_id,
+            from_chat_id=STORAGE_CHANNEL_ID,
+            message_ids=chunk
+        ))
+        result["delivered"] += len(copied)
+        # Telegram silently skips messages it can't copy (e.g. deleted from the storage channel)
+        result["skipped"] += len(chunk) - len(copied)
+        return True
+    except TelegramError as e:
+        log_error("deliver_chunk", e, chat_id=chat_id, message_ids=chunk)
+        if is_chat_error(e) or not isinstance(e, BadRequest):
+            # Single copies would fail the same way (chat gone, flood wait or network still failing)
+            result["failed_message_ids"].extend(chunk)
+            return not is_chat_error(e)
+
+    # A message-specific BadRequest: fall back to single copies so one bad message doesn't sink the chunk
+    for index, message_id in enumerate(chunk):
+        try:
+            await call_with_retry(lambda: bot.copy_message(
+                chat_id=chat_id,
+                from_chat_id=STORAGE_CHANNEL_ID,
+                message_id=message_id
+            ))
+            result["delivered"] += 1
+        except TelegramError as e:
+            log_error("deliver_file", e, chat_id=chat_id, message_id=message_id)
+            if is_chat_error(e):
+                result["failed_message_ids"].extend(chunk[index:])
+                return False
+            result["failed_message_ids"].append(message_id)
+    return True
+
+
+async def deliver_files(bot, chat_id: int, message_ids, progress: Optional[Dict] = None, checkpoint=None) -> Dict:
+    # message_ids is a list or an async iterator of storage message_ids. To resume an interrupted run,
+    # pass its last checkpointed result as progress and only the message_ids after progress["total"].
+    # checkpoint(result) is awaited after every chunk, so a resumed run repeats at most one chunk.
+    if isinstance(message_ids, list):
+        message_ids = iterate(message_ids)
+    result = progress or {"total": 0, "delivered": 0, "skipped": 0, "failed_message_ids": []}
+    async for chunk in chunk_message_ids(message_ids):
+        result["total"] += len(chunk)
+        delivered = result["delivered"]
+        if result.get("chat_unreachable"):
+            result["failed_message_ids"].extend(chunk)
+        elif not await copy_chunk(bot, chat_id, chunk, result):
+            result["chat_unreachable"] = True
+        FILES_DELIVERED.labels("delivered").inc(result["delivered"] - delivered)
+        FILES_DELIVERED.labels("failed").inc(len(chunk) - (result["delivered"] - delivered))
+        if checkpoint:
+            await checkpoint(result)
+    return result
+
+
+def delivery_report(result: Dict, delivery_id: Optional[ObjectId]) -> tuple:
+    failed = result["total"] - result["delivered"]
+    report = f"✅ Delivered {result['delivered']}/{result['total']} files."
+    if failed:
+        report += f"\n❌ Failed: {failed}"
+    reply_markup = None
+    if delivery_id and result["failed_message_ids"]:
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔁 Retry Failed Files", callback_data=f"retry_delivery_{delivery_id}")
+        ]])
+    return report, reply_markup
+
+
+async def deliver_batch(bot, chat_id: int, batch: Dict, progress: Optional[Dict] = None, checkpoint=None):
+    start = progress["total"] if progress else 0
+    message_ids = batch.get("message_ids")
+    if message_ids is None:
+        message_ids = iter_batch_message_ids(batch["_id"], start)
+    else:
+        message_ids = message_ids[start:]
+    result = await deliver_files(bot, chat_id, message_ids, progress, checkpoint)
+
+    # Only deliveries with failures are recorded, so the failed message_ids can be retried later.
+    # The id is checkpointed too, so a job re-run after this point doesn't record the delivery twice.
+    delivery_id = result.pop("delivery_id", None)
+    if delivery_id is None and (result["failed_message_ids"] or result["skipped"]):
+        delivery_id = await save_delivery({
+            "user_id": chat_id,
+            "batch_id": batch["_id"],
+            **result,
+            "created_at": datetime.now()
+        })
+        logger.warning("Delivery incomplete", extra={
+            "delivery_id": delivery_id,
+            "chat_id": chat_id,
+            "batch_id": batch["_id"],
+            "failed": len(result["failed_message_ids"]),
+            "skipped": result["skipped"]
+        })
+        if checkpoint:
+            await checkpoint({**result, "delivery_id": delivery_id})
+
+    report, reply_markup = delivery_report(result, delivery_id)
+    try:
+        await bot.send_message(chat_id=chat_id, text=report, reply_markup=reply_markup)
+    except TelegramError as e:
+        log_error("delivery_report", e, chat_id=chat_id)
+
+
+# File Ingestion
+# /gen files are buffered per admin and forwarded to the storage channel in bulk. Album parts
+# (same media_group_id) arrive as separate updates within milliseconds, so waiting for a short quiet
+# period lets a whole album - or any burst of files - go out in one forward_messages call.
+# Files already in the storage channel (matched by file_unique_id) are reused instead of forwarded.
+MEDIA_TYPES = ("animation", "audio", "document", "video", "video_note", "voice", "sticker", "photo")
+
+
+def describe_message(message) -> Dict:
+    # animation comes before document because animation messages carry both
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type)
+        if media:
+            if media_type == "photo":
+                media = media[-1]
+            return {"type": media_type, "file_unique_id": media.file_unique_id, "size": media.file_size}
+    return {"type": "text" if message.text else "other", "file_unique_id": None, "size": None}
+
+
+class FileIngestor:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._pending: Dict[int, List[tuple]] = {}  # user_id -> [(chat_id, message_id, file info)]
+        self._user_data: Dict[int, Dict] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._flushing: Dict[int, set] = {}  # user_id -> timer-driven flush tasks still running
+
+    def add(self, bot, user_id: int, user_data: Dict, message):
+        self._pending.setdefault(user_id, []).append((message.chat_id, message.message_id, describe_message(message)))
+        self._user_data[user_id] = user_data
+
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[user_id] = asyncio.get_running_loop().call_later(self.delay, self._schedule_flush, bot, user_id)
+
+    def _schedule_flush(self, bot, user_id: int):
+        self._timers.pop(user_id, None)
+        task = asyncio.create_task(self.flush(bot, user_id))
+        tasks = self._flushing.setdefault(user_id, set())
+        tasks.add(task)
+        task.add_done_callback(functools.partial(self._flush_done, user_id))
+
+    def _flush_done(self, user_id: int, task: asyncio.Task):
+        tasks = self._flushing.get(user_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._flushing[user_id]
+
+    async def discard(self, user_id: int):
+        # Drops the buffer and stops any flush in flight, so nothing from an abandoned /gen lands in the next one
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        self._pending.pop(user_id, None)
+        self._user_data.pop(user_id, None)
+        tasks = self._flushing.pop(user_id, set())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def flush(self, bot, user_id: int):
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            pending = sorted(self._pending.pop(user_id, []), key=lambda item: item[1])
+            user_data = self._user_data.pop(user_id, None)
+            if not pending or user_data is None:
+                return
+            try:
+                await self._store(bot, pending, user_data)
+            except Exception as e:
+                # Nothing is appended until every file is stored, so the whole buffer is lost
+                log_error("ingest_flush", e, exc_info=True, user_id=user_id, files=len(pending))
+                user_data["ingest_failed"] = user_data.get("ingest_failed", 0) + len(pending)
+
+    async def _store(self, bot, pending: List[tuple], user_data: Dict):
+        known = await find_stored_files(list({
+            info["file_unique_id"] for _, _, info in pending if info["file_unique_id"]
+        }))
+        storage_ids = {}  # source message_id -> storage message_id (None if it failed)
+        to_forward = []
+        forwarding = set()
+        for chat_id, message_id, info in pending:
+            file_unique_id = info["file_unique_id"]
+            if file_unique_id in known:
+                storage_ids[message_id] = known[file_unique_id]["message_id"]
+            elif file_unique_id and file_unique_id in forwarding:
+                continue  # Same file twice in one burst, resolved below
+            else:
+                if file_unique_id:
+                    forwarding.add(file_unique_id)
+                to_forward.append((chat_id, message_id, info))
+
+        new_files = []
+        for chat_id, chunk in self._chunks(to_forward):
+            stored = await self._forward(bot, chat_id, [message_id for message_id, _ in chunk])
+            for (message_id, info), storage_id in zip(chunk, stored):
+                storage_ids[message_id] = storage_id
+                if storage_id is not None and info["file_unique_id"]:
+                    known[info["file_unique_id"]] = {"message_id": storage_id}
+                    new_files.append({"message_id": storage_id, **info})
+        await register_stored_files(new_files)
+
+        # Append in the original order, reused and freshly forwarded files alike
+        for _, message_id, info in pending:
+            storage_id = storage_ids.get(message_id)
+            if storage_id is None and info["file_unique_id"] in known:
+                storage_id = known[info["file_unique_id"]]["message_id"]
+            if storage_id is None:
+                user_data["ingest_failed"] = user_data.get("ingest_failed", 0) + 1
+                continue
+            user_data["batch_files"].append({"message_id": storage_id, **info})
+            counts = user_data["file_counts"]
+            counts[info["type"]] = counts.get(info["type"], 0) + 1
+
+    @staticmethod
+    def _chunks(pending: List[tuple]):
+        chunk, chat_id = [], None
+        for source_chat_id, message_id, info in pending:
+            if chunk and (source_chat_id != chat_id or len(chunk) >= COPY_CHUNK_SIZE):
+                yield chat_id, chunk
+                chunk = []
+            chat_id = source_chat_id
+            chunk.append((message_id, info))
+        if chunk:
+            yield chat_id, chunk
+
+    async def _forward(self, bot, chat_id: int, message_ids: List[int]) -> List[Optional[int]]:
+        # Returns the storage message_id for each source message, None where forwarding failed
+        try:
+            forwarded = await call_with_retry(lambda: bot.forward_messages(
+                chat_id=STORAGE_CHANNEL_ID,
+                from_chat_id=chat_id,
+                message_ids=message_ids
+            ))
+            if len(forwarded) == len(message_ids):
+                return [message.message_id for message in forwarded]
+            logger.warning("Bulk forward skipped messages, retrying one by one", extra={
+                "requested": len(message_ids), "forwarded": len(forwarded)
+            })
+            # Some were forwarded; drop them and redo the chunk singly so the mapping stays exact
+            await self._delete_stored(bot, [message.message_id for message in forwarded])
+        except TelegramError as e:
+            log_error("ingest_chunk", e, chat_id=chat_id, message_ids=message_ids)
+
+        stored = []
+        for message_id in message_ids:
+            try:
+                forwarded = await call_with_retry(lambda: bot.forward_message(
+                    chat_id=STORAGE_CHANNEL_ID,
+                    from_chat_id=chat_id,
+                    message_id=message_id
+                ))
+                stored.append(forwarded.message_id)
+            except TelegramError as e:
+                log_error("ingest_file", e, chat_id=chat_id, message_id=message_id)
+                stored.append(None)
+        return stored
+
+    @staticmethod
+    async def _delete_stored(bot, message_ids: List[int]):
+        try:
+            await bot.delete_messages(chat_id=STORAGE_CHANNEL_ID, message_ids=message_ids)
+        except TelegramError as e:
+            log_error("ingest_cleanup", e, message_ids=message_ids)
+
+
+file_ingestor = FileIngestor(INGEST_FLUSH_DELAY)
+
+
+# Broadcast Engine
+# BROADCAST_RATE caps the broadcast's share of the global budget; its sends also queue behind everything else
+broadcast_limiter = TokenBucket(BROADCAST_RATE, BROADCAST_RATE)
+BROADCAST_COUNTERS = ("success", "blocked", "deactivated", "not_found", "failed")
+
+
+def classify_send_error(error: Exception) -> str:
+    message = str(error).lower()
+    if isinstance(error, Forbidden):
+        return "deactivated" if "deactivated" in message else "blocked"
+    if isinstance(error, BadRequest) and "chat not found" in message:
+        return "not_found"
+    return "failed"
+
+
+def format_broadcast_status(broadcast: Dict, rate: float = 0.0) -> str:
+    processed = sum(broadcast[key] for key in BROADCAST_COUNTERS)
+    total = broadcast["total"]
+
+    if broadcast["status"] == "done":
+        header = "✅ <b>Broadcast Completed!</b>"
+        footer = ""
+    else:
+        eta = f"{int((total - processed) / rate)}s" if rate > 0 and total > processed else "calculating..."
+        header = "📤 <b>Broadcasting...</b>"
+        footer = f"\n⚡ Speed: {rate:.1f} msg/s\n⏳ ETA: {eta}"
+
+    return (
+        f"{header}\n\n"
+        f"✅ Success: {broadcast['success']}\n"
+        f"🚫 Blocked: {broadcast['blocked']}\n"
+        f"💤 Deactivated: {broadcast['deactivated']}\n"
+        f"👻 Chat Not Found: {broadcast['not_found']}\n"
+        f"❌ Failed: {broadcast['failed']}\n"
+        f"📊 Progress: {processed}/{total}"
+        f"{footer}"
+    )
+
+
+async def edit_broadcast_status(bot, broadcast: Dict, rate: float = 0.0):
+    try:
+        await bot.edit_message_text(
+            chat_id=broadcast["status_chat_id"],
+            message_id=broadcast["status_message_id"],
+            text=format_broadcast_status(broadcast, rate),
+            parse_mode=ParseMode.HTML,
+            rate_limit_args=PRIORITY_BACKGROUND
+        )
+    except TelegramError as e:
+        log_error("broadcast_status", e, broadcast_id=broadcast["_id"])
+
+
+async def run_broadcast(bot, broadcast: Dict):
+    for key in BROADCAST_COUNTERS:
+        broadcast.setdefault(key, 0)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    started = time.monotonic()
+    last_status = started
+    sent_this_run = 0
+
+    async def send(user_id: int, dead_users: Dict[str, List[int]]):
+        async with semaphore:
+            await broadcast_limiter.acquire()
+            try:
+                await call_with_retry(lambda: bot.copy_message(
+                    chat_id=user_id,
+                    from_chat_id=broadcast["from_chat_id"],
+                    message_id=broadcast["message_id"],
+                    rate_limit_args=PRIORITY_BROADCAST
+                ))
+                broadcast["success"] += 1
+                BROADCAST_MESSAGES.labels("success").inc()
+            except Exception as e:
+                outcome = classify_send_error(e)
+                broadcast[outcome] += 1
+                BROADCAST_MESSAGES.labels(outcome).inc()
+                if outcome != "failed":
+                    dead_users.setdefault(outcome, []).append(user_id)
+
+    async def send_page(page: List[Dict]):
+        nonlocal sent_this_run, last_status
+        dead_users = {}
+        await asyncio.gather(*(send(user["user_id"], dead_users) for user in page))
+        await mark_users_inactive(dead_users)
+        sent_this_run += len(page)
+        broadcast["last_user_oid"] = page[-1]["_id"]
+
+        # Checkpoint so a restart resumes after this page
+        await update_broadcast(broadcast["_id"], {
+            key: broadcast[key] for key in ("last_user_oid",) + BROADCAST_COUNTERS
+        })
+
+        now = time.monotonic()
+        if now - last_status >= BROADCAST_STATUS_INTERVAL:
+            last_status = now
+            await edit_broadcast_status(bot, broadcast, sent_this_run / (now - started))
+
+    page = []
+    async for user in iter_user_ids(broadcast.get("last_user_oid")):
+        page.append(user)
+        if len(page) >= BROADCAST_PAGE_SIZE:
+            await send_page(page)
+            page = []
+    if page:
+        await send_page(page)
+
+    broadcast["status"] = "done"
+    await update_broadcast(broadcast["_id"], {"status": "done", "finished_at": datetime.now()})
+    await edit_broadcast_status(bot, broadcast)
+
+
+async def run_broadcast_job(bot, job: Dict, checkpoint):
+    # run_broadcast checkpoints on the broadcast document after every page instead
+    broadcast = await get_broadcast(job["payload"]["broadcast_id"])
+    if broadcast and broadcast["status"] == "running":
+        await run_broadcast(bot, broadcast)
+
+
+# Job Workers
+# Handlers get the claimed job and a checkpoint coroutine that stores progress on it. Deliveries
+# checkpoint after every chunk and resume from job["progress"], so a retried or taken-over job
+# doesn't send the user files they already have.
+class JobLeaseLost(Exception):
+    pass
+
+
+async def run_delivery_job(bot, job: Dict, checkpoint):
+    payload = job["payload"]
+    # Straight from MongoDB: worker processes never see the bot's batch_cache invalidations, and
+    # without cached message_ids deliver_batch streams the files from batch_files
+    batch = await get_batch(payload["batch_id"])
+    if not batch:
+        logger.warning("Batch gone before delivery", extra=payload)
+        return
+    await deliver_batch(bot, payload["chat_id"], batch, job.get("progress"), checkpoint)
+
+
+async def run_retry_delivery_job(bot, job: Dict, checkpoint):
+    # message_ids and delivered_before are snapshotted at enqueue time, so a re-run writes the same totals
+    payload = job["payload"]
+    if "message_ids" not in payload:
+        # Enqueued before the snapshot fields existed
+        delivery = await get_delivery(payload["delivery_id"], payload["user_id"])
+        if not delivery or not delivery.get("failed_message_ids"):
+            return
+        payload = {**payload, "message_ids": delivery["failed_message_ids"], "delivered_before": delivery.get("delivered", 0)}
+    progress = job.get("progress")
+    message_ids = payload["message_ids"][progress["total"] if progress else 0:]
+    result = await deliver_files(bot, payload["user_id"], message_ids, progress, checkpoint)
+    delivery_id = ObjectId(payload["delivery_id"])
+    await update_delivery(delivery_id, {
+        "failed_message_ids": result["failed_message_ids"],
+        "delivered": payload["delivered_before"] + result["delivered"],
+        "retried_at": datetime.now()
+    })
+
+    report, reply_markup = delivery_report(result, delivery_id)
+    await bot.send_message(chat_id=payload["user_id"], text=report, reply_markup=reply_markup)
+
+
+JOB_HANDLERS = {
+    "deliver": run_delivery_job,
+    "retry_delivery": run_retry_delivery_job,
+    "broadcast": run_broadcast_job,
+}
+
+
+class JobWorker:
+    def __init__(self, bot, worker_id: str):
+        self.bot = bot
+        self.worker_id = worker_id
+        self.stopping = False
+        self._current: Optional[asyncio.Task] = None
+        self._lease_lost = False
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                job = await claim_job(self.worker_id)
+            except PyMongoError as e:
+                log_error("job_claim", e, worker=self.worker_id)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(jobs_available.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                jobs_available.clear()
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Dict):
+        handler = JOB_HANDLERS.get(job["type"])
+        if handler is None:
+            await fail_job({**job, "attempts": JOB_MAX_ATTEMPTS}, self.worker_id, ValueError(f"unknown job type {job['type']}"))
+            return
+
+        self._lease_lost = False
+        self._current = asyncio.create_task(handler(self.bot, job, functools.partial(self._checkpoint, job["_id"])))
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"]))
+        try:
+            await self._current
+            await finish_job(job["_id"], self.worker_id)
+            JOBS.labels(job["type"], "done").inc()
+        except asyncio.CancelledError:
+            if self.stopping:
+                await release_job(job["_id"], self.worker_id)
+                JOBS.labels(job["type"], "released").inc()
+            elif self._lease_lost:
+                JOBS.labels(job["type"], "lease_lost").inc()
+            else:
+                raise
+        except JobLeaseLost:
+            logger.warning("Job lease lost", extra={"job_id": job["_id"], "worker": self.worker_id})
+            JOBS.labels(job["type"], "lease_lost").inc()
+        except Exception as e:
+            log_error("job", e, exc_info=True, job_id=job["_id"], job_type=job["type"], attempts=job["attempts"])
+            await fail_job(job, self.worker_id, e)
+            JOBS.labels(job["type"], "failed").inc()
+        finally:
+            heartbeat.cancel()
+            self._current = None
+
+    async def _checkpoint(self, job_id: ObjectId, progress: Dict):
+        if not await save_job_progress(job_id, self.worker_id, progress):
+            raise JobLeaseLost(job_id)
+
+    async def _heartbeat(self, job_id: ObjectId):
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            try:
+                renewed = await renew_job_lease(job_id, self.worker_id)
+            except PyMongoError as e:
+                log_error("job_heartbeat", e, job_id=job_id)
+                continue
+            if not renewed:
+                # Another worker took the job over after our lease lapsed; stop duplicating its work
+                logger.warning("Job lease lost", extra={"job_id": job_id, "worker": self.worker_id})
+                self._lease_lost = True
+                self._current.cancel()
+                return
+
+    def stop(self):
+        self.stopping = True
+        if self._current:
+            self._current.cancel()
+
+
+class JobPool:
+    def __init__(self):
+        self._workers: List[JobWorker] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, bot, size: int):
+        for index in range(size):
+            worker = JobWorker(bot, f"{PROCESS_ID}:{index}")
+            self._workers.append(worker)
+            self._tasks.append(asyncio.create_task(worker.run()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.stop()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._workers, self._tasks = [], []
+
+
+job_pool = JobPool()
+
+
+# Admin Notifications
+class AdminNotifier:
+    # Collects new-user events off the request path and fans them out to admins in the background
+    DIGEST_NAMES = 5
+
+    def __init__(self, digest_interval: int, rate: float):
+        self.digest_interval = digest_interval
+        self._queue = asyncio.Queue()
+        self._limiter = TokenBucket(rate, rate)
+
+    def new_user(self, user):
+        self._queue.put_nowait(user)
+
+    def _drain(self) -> List:
+        joined = []
+        while not self._queue.empty():
+            joined.append(self._queue.get_nowait())
+        return joined
+
+    async def _next_notification(self) -> Optional[str]:
+        if self.digest_interval <= 0:
+            user = await self._queue.get()
+            total_users = await count_users()
+            return (
+                f"👤 <b>New User Joined!</b>\n\n"
+                f"📊 User Count: <b>{total_users}</b>\n"
+                f"👤 Name: {html.escape(user.first_name)} {html.escape(user.last_name or '')}\n"
+                f"🆔 Username: @{html.escape(user.username or 'N/A')}\n"
+                f"💬 Chat ID: <code>{user.id}</code>"
+            )
+
+        await asyncio.sleep(self.digest_interval)
+        joined = self._drain()
+        if not joined:
+            return None
+
+        total_users = await count_users()
+        names = "\n".join(
+            f"• {html.escape(user.first_name)} (<code>{user.id}</code>)" for user in joined[:self.DIGEST_NAMES]
+        )
+        more = f"\n… and {len(joined) - self.DIGEST_NAMES} more" if len(joined) > self.DIGEST_NAMES else ""
+        return (
+            f"👥 <b>+{len(joined):,} new users</b> in the last {self.digest_interval}s\n"
+            f"📊 Total users: <b>{total_users:,}</b>\n\n"
+            f"{names}{more}"
+        )
+
+    async def run(self, bot):
+        while True:
+            try:
+                notification = await self._next_notification()
+            except Exception as e:
+                log_error("admin_notification", e)
+                continue
+            if not notification:
+                continue
+
+            for admin_id in settings_cache.admin_ids | {OWNER_ID}:
+                await self._limiter.acquire()
+                try:
+                    await bot.send_message(
+                        chat_id=admin_id,
+                        text=notification,
+                        parse_mode=ParseMode.HTML,
+                        rate_limit_args=PRIORITY_BACKGROUND
+                    )
+                except Exception as e:
+                    log_error("admin_notification", e, admin_id=admin_id)
+
+
+admin_notifier = AdminNotifier(NEW_USER_DIGEST_INTERVAL, ADMIN_NOTIFY_RATE)
+
+
 # Admin Commands
 async def add_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
@@ -83,7 +2264,9 @@ async def add_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         channel_id = int(context.args[0])
-        fsub_channels.update_one({"channel_id": channel_id}, {"$set": {"channel_id": channel_id}}, upsert=True)
+        await save_fsub_channel(channel_id)
+        if channel_id not in settings_cache.fsub_channels:
+            settings_cache.fsub_channels.append(channel_id)
         await update.message.reply_text(f"✅ Force subscribe channel {channel_id} added successfully!")
     except ValueError:
         await update.message.reply_text("❌ Invalid channel ID. Please provide a valid integer.")
@@ -100,8 +2283,9 @@ async def remove_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         channel_id = int(context.args[0])
-        result = fsub_channels.delete_one({"channel_id": channel_id})
-        if result.deleted_count > 0:
+        if await delete_fsub_channel(channel_id):
+            settings_cache.fsub_channels = [ch for ch in settings_cache.fsub_channels if ch != channel_id]
+            fsub_checker.forget_channel(channel_id)
             await update.message.reply_text(f"✅ Force subscribe channel {channel_id} removed successfully!")
         else:
             await update.message.reply_text("❌ Channel not found in the list.")
@@ -114,14 +2298,14 @@ async def list_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
 
-    channels = list(fsub_channels.find())
+    channels = get_fsub_channels()
     if not channels:
         await update.message.reply_text("📋 No force subscribe channels configured.")
         return
 
     text = "📋 <b>Force Subscribe Channels:</b>\n\n"
     for ch in channels:
-        text += f"• <code>{ch['channel_id']}</code>\n"
+        text += f"• <code>{ch}</code>\n"
     await update.message.reply_text(text, parse_mode=ParseMode.HTML)
 
 
@@ -136,7 +2320,8 @@ async def add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         user_id = int(context.args[0])
-        admins.update_one({"user_id": user_id}, {"$set": {"user_id": user_id, "is_owner": False}}, upsert=True)
+        await save_admin(user_id)
+        settings_cache.admin_ids.add(user_id)
         await update.message.reply_text(f"✅ User {user_id} added as admin!")
     except ValueError:
         await update.message.reply_text("❌ Invalid user ID.")
@@ -156,8 +2341,8 @@ async def remove_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user_id == OWNER_ID:
             await update.message.reply_text("❌ Cannot remove the owner!")
             return
-        result = admins.delete_one({"user_id": user_id})
-        if result.deleted_count > 0:
+        if await delete_admin(user_id):
+            settings_cache.admin_ids.discard(user_id)
             await update.message.reply_text(f"✅ User {user_id} removed from admins!")
         else:
             await update.message.reply_text("❌ User not found in admin list.")
@@ -170,7 +2355,7 @@ async def list_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
 
-    admin_list = list(admins.find())
+    admin_list = await get_admins()
     if not admin_list:
         await update.message.reply_text("📋 No admins found.")
         return
@@ -188,8 +2373,10 @@ async def gen_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
 
+    await file_ingestor.discard(update.effective_user.id)
     context.user_data["batch_files"] = []
-    context.user_data["file_counts"] = {"audio": 0, "video": 0, "document": 0, "photo": 0}
+    context.user_data["file_counts"] = {}
+    context.user_data["ingest_failed"] = 0
     
     keyboard = [[InlineKeyboardButton("✅ Done", callback_data="gen_done")]]
     await update.message.reply_text(
@@ -202,30 +2389,8 @@ async def gen_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def gen_receive_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    message = update.message
-    
-    # Forward file to storage channel
-    forwarded = await message.forward(STORAGE_CHANNEL_ID)
-    
-    file_type = None
-    if message.audio:
-        file_type = "audio"
-        context.user_data["file_counts"]["audio"] += 1
-    elif message.video:
-        file_type = "video"
-        context.user_data["file_counts"]["video"] += 1
-    elif message.document:
-        file_type = "document"
-        context.user_data["file_counts"]["document"] += 1
-    elif message.photo:
-        file_type = "photo"
-        context.user_data["file_counts"]["photo"] += 1
-    
-    context.user_data["batch_files"].append({
-        "message_id": forwarded.message_id,
-        "type": file_type
-    })
-    
+    # Buffered and forwarded to the storage channel in bulk
+    file_ingestor.add(context.bot, update.effective_user.id, context.user_data, update.message)
     return GEN_WAITING_FILES
 
 
@@ -233,18 +2398,23 @@ async def gen_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    # Make sure files still waiting in the buffer are stored first
+    await file_ingestor.flush(context.bot, update.effective_user.id)
+    
     files = context.user_data.get("batch_files", [])
     counts = context.user_data.get("file_counts", {})
+    failed = context.user_data.get("ingest_failed", 0)
     
     if not files:
         await query.edit_message_text("❌ No files received. Operation cancelled.")
         return ConversationHandler.END
     
-    count_text = "\n".join([f"• {k.title()}: {v}" for k, v in counts.items() if v > 0])
+    count_text = "\n".join([f"• {k.replace('_', ' ').title()}: {v}" for k, v in counts.items() if v > 0])
+    failed_text = f"⚠️ Failed to store: {failed}\n" if failed else ""
     
     await query.edit_message_text(
         f"📊 <b>Files Received:</b>\n\n{count_text}\n\n"
-        f"Total files: {len(files)}\n\n"
+        f"Total files: {len(files)}\n{failed_text}\n"
         "📝 Now send me the title for this batch:",
         parse_mode=ParseMode.HTML
     )
@@ -258,14 +2428,12 @@ async def gen_receive_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Create batch in database
     batch_data = {
         "title": title,
-        "files": files,
         "created_by": update.effective_user.id,
         "created_at": datetime.now(),
         "views": 0
     }
     
-    result = batches.insert_one(batch_data)
-    batch_id = str(result.inserted_id)
+    batch_id = await create_batch(batch_data, files)
     link = generate_batch_link(batch_id)
     
     await update.message.reply_text(
@@ -285,25 +2453,8 @@ async def list_batches(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
     
-    batch_list = list(batches.find().sort("created_at", -1).limit(20))
-    
-    if not batch_list:
-        await update.message.reply_text("📋 No batches found.")
-        return
-    
-    keyboard = []
-    for batch in batch_list:
-        batch_id = str(batch["_id"])
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {batch['title']}", 
-            callback_data=f"batch_view_{batch_id}"
-        )])
-    
-    await update.message.reply_text(
-        "📋 <b>All Batches:</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML
-    )
+    text, reply_markup = await render_batch_page(ADMIN_VIEW)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
 async def batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -313,10 +2464,10 @@ async def batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     batch_id = query.data.split("_")[2]
     
     try:
-        from bson import ObjectId
-        batch = batches.find_one({"_id": ObjectId(batch_id)})
+        batch = await get_batch(batch_id)
     except Exception as e:
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        log_error("batch_view", e, exc_info=True, batch_id=batch_id)
+        await query.edit_message_text(ERROR_REPLY)
         return
     
     if not batch:
@@ -325,6 +2476,12 @@ async def batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     link = generate_batch_link(batch_id)
     
+    trend_text = ""
+    if VIEW_DAILY_BUCKETS:
+        daily = await get_daily_views(batch_id)
+        if daily:
+            trend_text = "📈 Last 7 Days:\n" + "\n".join(f"• {day['day']}: {day['views']}" for day in daily) + "\n"
+    
     keyboard = [
         [
             InlineKeyboardButton("✏️ Edit Title", callback_data=f"batch_edit_{batch_id}"),
@@ -336,8 +2493,9 @@ async def batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text(
         f"📦 <b>Batch Details:</b>\n\n"
         f"📝 Title: {batch['title']}\n"
-        f"📁 Files: {len(batch['files'])}\n"
-        f"👁️ Views: {batch.get('views', 0)}\n\n"
+        f"📁 Files: {batch.get('file_count', 0)}\n"
+        f"👁️ Views: {batch.get('views', 0) + view_counter.pending(batch['_id'])}\n"
+        f"{trend_text}\n"
         f"🔗 Link: <code>{link}</code>",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode=ParseMode.HTML
@@ -373,13 +2531,7 @@ async def batch_edit_receive_title(update: Update, context: ContextTypes.DEFAULT
     new_title = update.message.text.strip()
     
     try:
-        from bson import ObjectId
-        result = batches.update_one(
-            {"_id": ObjectId(batch_id)},
-            {"$set": {"title": new_title}}
-        )
-        
-        if result.modified_count > 0:
+        if await rename_batch(batch_id, new_title):
             await update.message.reply_text(
                 f"✅ Batch title updated to: <b>{new_title}</b>",
                 parse_mode=ParseMode.HTML
@@ -387,7 +2539,8 @@ async def batch_edit_receive_title(update: Update, context: ContextTypes.DEFAULT
         else:
             await update.message.reply_text("❌ Batch not found or title unchanged.")
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        log_error("batch_edit", e, exc_info=True, batch_id=batch_id)
+        await update.message.reply_text(ERROR_REPLY)
     
     # Clear the editing state
     context.user_data.pop("editing_batch_id", None)
@@ -400,82 +2553,52 @@ async def batch_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     batch_id = query.data.split("_")[2]
     
     try:
-        from bson import ObjectId
-        result = batches.delete_one({"_id": ObjectId(batch_id)})
-        if result.deleted_count > 0:
+        if await delete_batch(batch_id):
             await query.edit_message_text("✅ Batch deleted successfully!")
         else:
             await query.edit_message_text("❌ Batch not found.")
     except Exception as e:
-        await query.edit_message_text(f"❌ Error deleting batch: {str(e)}")
+        log_error("batch_delete", e, exc_info=True, batch_id=batch_id)
+        await query.edit_message_text(ERROR_REPLY)
 
 
 async def batch_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    batch_list = list(batches.find().sort("created_at", -1).limit(20))
+    text, reply_markup = await render_batch_page(ADMIN_VIEW)
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+
+
+async def batch_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    _, view, direction, cursor = query.data.split("_", 3)
     
-    if not batch_list:
-        await query.edit_message_text("📋 No batches found.")
+    if view == ADMIN_VIEW and not is_admin(query.from_user.id):
+        await query.answer("⛔ You are not authorized.", show_alert=True)
         return
+    await query.answer()
     
-    keyboard = []
-    for batch in batch_list:
-        batch_id = str(batch["_id"])
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {batch['title']}", 
-            callback_data=f"batch_view_{batch_id}"
-        )])
+    try:
+        text, reply_markup = await render_batch_page(view, cursor, older=direction == "n")
+    except Exception as e:
+        log_error("batch_page", e, exc_info=True, view=view, cursor=cursor)
+        await query.edit_message_text(ERROR_REPLY)
+        return
     
-    await query.edit_message_text(
-        "📋 <b>All Batches:</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML
-    )
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
 # User Side
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
-    # Check if user is new
-    existing_user = users.find_one({"user_id": user.id})
-    is_new_user = existing_user is None
-    
-    users.update_one(
-        {"user_id": user.id},
-        {"$set": {
-            "username": user.username,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "last_active": datetime.now()
-        }},
-        upsert=True
-    )
+    # Check if user is new (single upsert, last_active writes are coalesced)
+    is_new_user = await record_user(user)
     
-    # Notify admins about new user
+    # Notify admins about new user (queued, sent in the background)
     if is_new_user:
-        total_users = users.count_documents({})
-        admin_list = list(admins.find())
-        
-        notification = (
-            f"👤 <b>New User Joined!</b>\n\n"
-            f"📊 User Count: <b>{total_users}</b>\n"
-            f"👤 Name: {user.first_name} {user.last_name or ''}\n"
-            f"🆔 Username: @{user.username or 'N/A'}\n"
-            f"💬 Chat ID: <code>{user.id}</code>"
-        )
-        
-        for admin in admin_list:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin["user_id"],
-                    text=notification,
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                print(f"Error notifying admin {admin['user_id']}: {e}")
+        admin_notifier.new_user(user)
     
     # Check if starting with batch link
     if context.args and context.args[0].startswith("batch_"):
@@ -490,118 +2613,57 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@instrument
 async def send_batch_files(update: Update, context: ContextTypes.DEFAULT_TYPE, batch_id: str):
     user_id = update.effective_user.id
     
-    # Check force subscribe - check each channel individually
-    channels = get_fsub_channels()
-    not_joined = []
-    
-    for ch_id in channels:
-        try:
-            member = await context.bot.get_chat_member(ch_id, user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                not_joined.append(ch_id)
-        except Exception:
-            not_joined.append(ch_id)
+    # Check force subscribe - all channels are checked concurrently
+    not_joined = await fsub_checker.not_joined(context.bot, user_id)
     
     if not_joined:
-        keyboard = []
-        for ch_id in not_joined:
-            try:
-                chat = await context.bot.get_chat(ch_id)
-                invite_link = f"https://t.me/{chat.username}" if chat.username else await context.bot.export_chat_invite_link(ch_id)
-                keyboard.append([InlineKeyboardButton(f"Join {chat.title}", url=invite_link)])
-            except Exception as e:
-                print(f"Error getting channel info: {e}")
-        
-        keyboard.append([InlineKeyboardButton("✅ I Joined All", callback_data=f"check_fsub_{batch_id}")])
-        
         await update.message.reply_text(
             "⚠️ You must join the following channels to access files:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=await fsub_checker.join_keyboard(context.bot, not_joined, f"check_fsub_{batch_id}")
         )
         return
     
     try:
-        from bson import ObjectId
-        batch = batches.find_one({"_id": ObjectId(batch_id)})
-    except:
+        batch = await get_cached_batch(batch_id)
+    except (InvalidId, ValueError):
         await update.message.reply_text("❌ Invalid batch link.")
         return
+    except Exception as e:
+        log_error("send_batch", e, exc_info=True, batch_id=batch_id, user_id=user_id)
+        await update.message.reply_text(ERROR_REPLY)
+        return
     
     if not batch:
         await update.message.reply_text("❌ Batch not found.")
         return
     
     # Update views
-    batches.update_one({"_id": batch["_id"]}, {"$inc": {"views": 1}})
+    view_counter.add(batch["_id"])
     
     await update.message.reply_text(f"📦 <b>{batch['title']}</b>\n\nSending files...", parse_mode=ParseMode.HTML)
     
-    for file_data in batch["files"]:
-        try:
-            await context.bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=STORAGE_CHANNEL_ID,
-                message_id=file_data["message_id"]
-            )
-        except Exception as e:
-            print(f"Error sending file: {e}")
+    await enqueue_job("deliver", {"chat_id": user_id, "batch_id": batch_id})
 
 
 async def browse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check force subscribe
-    channels = get_fsub_channels()
-    not_joined = []
-    
-    for ch_id in channels:
-        try:
-            member = await context.bot.get_chat_member(ch_id, user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                not_joined.append(ch_id)
-        except Exception:
-            not_joined.append(ch_id)
+    not_joined = await fsub_checker.not_joined(context.bot, user_id)
     
     if not_joined:
-        keyboard = []
-        for ch_id in not_joined:
-            try:
-                chat = await context.bot.get_chat(ch_id)
-                invite_link = f"https://t.me/{chat.username}" if chat.username else await context.bot.export_chat_invite_link(ch_id)
-                keyboard.append([InlineKeyboardButton(f"Join {chat.title}", url=invite_link)])
-            except Exception as e:
-                print(f"Error getting channel info: {e}")
-        
-        keyboard.append([InlineKeyboardButton("✅ I Joined All", callback_data="check_browse")])
-        
         await update.message.reply_text(
             "⚠️ You must join the following channels to browse files:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=await fsub_checker.join_keyboard(context.bot, not_joined, "check_browse")
         )
         return
     
-    batch_list = list(batches.find().sort("created_at", -1).limit(20))
-    
-    if not batch_list:
-        await update.message.reply_text("📋 No files available yet.")
-        return
-    
-    keyboard = []
-    for batch in batch_list:
-        batch_id = str(batch["_id"])
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {batch['title']}", 
-            callback_data=f"user_batch_{batch_id}"
-        )])
-    
-    await update.message.reply_text(
-        "📂 <b>Browse Files:</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML
-    )
+    text, reply_markup = await render_batch_page(USER_VIEW)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
 async def search_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -612,29 +2674,35 @@ async def search_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def search_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query_text = update.message.text.strip()
     
-    # Search in titles
-    results = list(batches.find({"title": {"$regex": query_text, "$options": "i"}}).limit(20))
+    # Search in titles (in-memory index, the query is tokenized so it's never run as a pattern)
+    text, reply_markup = search_results_page(query_text, 0)
     
-    if not results:
+    if not text:
         await update.message.reply_text("❌ No results found.")
         return ConversationHandler.END
     
-    keyboard = []
-    for batch in results:
-        batch_id = str(batch["_id"])
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {batch['title']}", 
-            callback_data=f"user_batch_{batch_id}"
-        )])
-    
-    await update.message.reply_text(
-        f"🔍 <b>Search Results for '{query_text}':</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML
-    )
+    context.user_data["search_query"] = query_text
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
     return ConversationHandler.END
 
 
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    query_text = context.user_data.get("search_query")
+    if not query_text:
+        await query.edit_message_text("❌ Search expired. Please search again.")
+        return
+    
+    text, reply_markup = search_results_page(query_text, int(query.data.split("_")[2]))
+    if not text:
+        await query.edit_message_text("❌ No results found.")
+        return
+    
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+
+
 async def check_browse_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -642,41 +2710,15 @@ async def check_browse_callback(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = query.from_user.id
     
     # Check if user joined all channels
-    channels = get_fsub_channels()
-    not_joined = []
-    
-    for ch_id in channels:
-        try:
-            member = await context.bot.get_chat_member(ch_id, user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                not_joined.append(ch_id)
-        except Exception:
-            not_joined.append(ch_id)
+    not_joined = await fsub_checker.not_joined(context.bot, user_id)
     
     if not_joined:
         await query.answer("❌ Please join all channels first!", show_alert=True)
         return
     
     # User joined, show browse list
-    batch_list = list(batches.find().sort("created_at", -1).limit(20))
-    
-    if not batch_list:
-        await query.edit_message_text("📋 No files available yet.")
-        return
-    
-    keyboard = []
-    for batch in batch_list:
-        batch_id = str(batch["_id"])
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {batch['title']}", 
-            callback_data=f"user_batch_{batch_id}"
-        )])
-    
-    await query.edit_message_text(
-        "📂 <b>Browse Files:</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML
-    )
+    text, reply_markup = await render_batch_page(USER_VIEW)
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
 async def user_batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -689,13 +2731,12 @@ async def user_batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [[InlineKeyboardButton("📥 Get Files", url=link)]]
     
     try:
-        from bson import ObjectId
-        batch = batches.find_one({"_id": ObjectId(batch_id)})
+        batch = await get_cached_batch(batch_id)
         
         if batch:
             await query.message.reply_text(
                 f"📦 <b>{batch['title']}</b>\n\n"
-                f"📁 Files: {len(batch['files'])}\n\n"
+                f"📁 Files: {batch.get('file_count', 0)}\n\n"
                 f"Click the button below to get files:",
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode=ParseMode.HTML
@@ -703,7 +2744,8 @@ async def user_batch_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await query.message.reply_text("❌ Batch not found.")
     except Exception as e:
-        await query.message.reply_text(f"❌ Error: {str(e)}")
+        log_error("user_batch_view", e, exc_info=True, batch_id=batch_id)
+        await query.message.reply_text(ERROR_REPLY)
 
 
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -740,6 +2782,8 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 <b>Bot Stats & Management:</b>
 /dashboard - View bot statistics
+/rebuildstats - Recount dashboard statistics
+/perf - Show handler latency (p50/p99)
 /broadcast - Broadcast message to all users
 /cmd - Show this command list
 """
@@ -752,26 +2796,74 @@ async def dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
     
-    # Get statistics
-    total_users = users.count_documents({})
-    total_batches = batches.count_documents({})
-    total_files = sum([len(batch.get("files", [])) for batch in batches.find()])
-    total_fsub = fsub_channels.count_documents({})
-    total_admins = admins.count_documents({})
+    # Get statistics (pre-aggregated counters)
+    stats = await get_stats()
+    batch_stats = batch_cache.stats()
+    
+    daily_text = "\n".join(
+        f"• {day['_id']}: +{day.get('new_users', 0)} users, {day.get('deliveries', 0)} deliveries"
+        for day in stats["daily"]
+    ) or "• No activity yet"
     
     dashboard_text = f"""
 📊 <b>Bot Dashboard</b>
 
-👥 Total Users: <b>{total_users}</b>
-📦 Total Batches: <b>{total_batches}</b>
-📁 Total Files: <b>{total_files}</b>
-📢 Force Subscribe Channels: <b>{total_fsub}</b>
-🛡️ Total Admins: <b>{total_admins}</b>
+👥 Total Users: <b>{stats['users']}</b>
+🟢 Active Users: <b>{stats['active_users']}</b>
+📦 Total Batches: <b>{stats['batches']}</b>
+📁 Total Files: <b>{stats['files']}</b>
+👁️ Total Views: <b>{stats['views']}</b>
+📢 Force Subscribe Channels: <b>{stats['fsub']}</b>
+🛡️ Total Admins: <b>{stats['admins']}</b>
+🗂️ Page Cache: <b>{page_cache.hits}</b> hits / <b>{page_cache.misses}</b> misses
+📦 Batch Cache: <b>{batch_stats['batches']}</b> batches, <b>{batch_stats['files']}</b> files, <b>{batch_stats['hits']}</b> hits / <b>{batch_stats['misses']}</b> misses
+
+📅 <b>Last 7 Days:</b>
+{daily_text}
 """
     
     await update.message.reply_text(dashboard_text, parse_mode=ParseMode.HTML)
 
 
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔ You are not authorized to use this command.")
+        return
+    
+    if not latency_samples:
+        await update.message.reply_text("⏱️ No handler timings recorded yet.")
+        return
+    
+    lines = []
+    for name, samples in sorted(latency_samples.items()):
+        samples = list(samples)
+        lines.append(
+            f"• <code>{name}</code>: p50 {percentile(samples, 0.5) * 1000:.0f}ms · "
+            f"p99 {percentile(samples, 0.99) * 1000:.0f}ms (n={len(samples)})"
+        )
+    
+    await update.message.reply_text(
+        "⏱️ <b>Handler Latency</b>\n\n" + "\n".join(lines),
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def rebuild_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔ You are not authorized to use this command.")
+        return
+    
+    status_msg = await update.message.reply_text("🔄 Rebuilding statistics...")
+    totals = await rebuild_stats()
+    await status_msg.edit_text(
+        f"✅ <b>Statistics rebuilt!</b>\n\n"
+        f"👥 Users: {totals['users']}\n"
+        f"📦 Batches: {totals['batches']}\n"
+        f"📁 Files: {totals['files']}",
+        parse_mode=ParseMode.HTML
+    )
+
+
 async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
@@ -789,32 +2881,24 @@ async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
-    all_users = list(users.find())
-    
     status_msg = await update.message.reply_text("📤 Broadcasting message...")
     
-    success = 0
-    failed = 0
-    blocked = 0
-    
-    for user in all_users:
-        try:
-            await message.copy(chat_id=user["user_id"])
-            success += 1
-        except Exception as e:
-            if "blocked" in str(e).lower():
-                blocked += 1
-            else:
-                failed += 1
+    broadcast = {
+        "from_chat_id": message.chat_id,
+        "message_id": message.message_id,
+        "status_chat_id": status_msg.chat_id,
+        "status_message_id": status_msg.message_id,
+        "created_by": update.effective_user.id,
+        "status": "running",
+        "total": await count_active_users(),
+        "last_user_oid": None,
+        **{key: 0 for key in BROADCAST_COUNTERS},
+        "created_at": datetime.now()
+    }
+    broadcast["_id"] = await create_broadcast(broadcast)
     
-    await status_msg.edit_text(
-        f"✅ <b>Broadcast Completed!</b>\n\n"
-        f"✅ Success: {success}\n"
-        f"🚫 Blocked: {blocked}\n"
-        f"❌ Failed: {failed}\n"
-        f"📊 Total: {len(all_users)}",
-        parse_mode=ParseMode.HTML
-    )
+    # Runs on a job worker so the admin's conversation isn't held up
+    await enqueue_job("broadcast", {"broadcast_id": broadcast["_id"]})
     
     return ConversationHandler.END
 
@@ -832,16 +2916,7 @@ async def check_fsub_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = query.from_user.id
     
     # Check if user joined all channels
-    channels = get_fsub_channels()
-    not_joined = []
-    
-    for ch_id in channels:
-        try:
-            member = await context.bot.get_chat_member(ch_id, user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                not_joined.append(ch_id)
-        except Exception:
-            not_joined.append(ch_id)
+    not_joined = await fsub_checker.not_joined(context.bot, user_id)
     
     if not_joined:
         await query.answer("❌ Please join all channels first!", show_alert=True)
@@ -849,30 +2924,53 @@ async def check_fsub_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # User joined all channels, send files
     try:
-        from bson import ObjectId
-        batch = batches.find_one({"_id": ObjectId(batch_id)})
-    except:
+        batch = await get_cached_batch(batch_id)
+    except (InvalidId, ValueError):
         await query.edit_message_text("❌ Invalid batch link.")
         return
+    except Exception as e:
+        log_error("check_fsub", e, exc_info=True, batch_id=batch_id, user_id=user_id)
+        await query.edit_message_text(ERROR_REPLY)
+        return
     
     if not batch:
         await query.edit_message_text("❌ Batch not found.")
         return
     
     # Update views
-    batches.update_one({"_id": batch["_id"]}, {"$inc": {"views": 1}})
+    view_counter.add(batch["_id"])
     
     await query.edit_message_text(f"📦 <b>{batch['title']}</b>\n\nSending files...", parse_mode=ParseMode.HTML)
     
-    for file_data in batch["files"]:
-        try:
-            await context.bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=STORAGE_CHANNEL_ID,
-                message_id=file_data["message_id"]
-            )
-        except Exception as e:
-            print(f"Error sending file: {e}")
+    await enqueue_job("deliver", {"chat_id": user_id, "batch_id": batch_id})
+
+
+async def retry_delivery_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    try:
+        delivery = await get_delivery(query.data.split("_")[2], user_id)
+    except Exception as e:
+        log_error("retry_delivery", e, user_id=user_id)
+        delivery = None
+    
+    if not delivery or not delivery.get("failed_message_ids"):
+        await query.answer("❌ Nothing to retry.", show_alert=True)
+        return
+    await query.answer()
+    await query.edit_message_reply_markup(reply_markup=None)
+    
+    await enqueue_job("retry_delivery", {
+        "delivery_id": str(delivery["_id"]),
+        "user_id": user_id,
+        "message_ids": delivery["failed_message_ids"],
+        "delivered_before": delivery.get("delivered", 0)
+    })
+
+
+async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    log_error("handler", context.error, exc_info=True, update_id=getattr(update, "update_id", None))
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -895,34 +2993,355 @@ async def set_bot_username(app):
     global BOT_USERNAME
     me = await app.bot.get_me()
     BOT_USERNAME = me.username
-    print(f"🤖 Bot username detected: @{BOT_USERNAME}")
+    logger.info("Bot username detected", extra={"username": BOT_USERNAME})
+
+
+background_tasks: List[asyncio.Task] = []  # Endless loops started in post_init, cancelled in post_stop
+
+
+async def post_init(app):
+    await run_migrations()
+    await init_owner()
+    await settings_cache.load()
+    if CACHE_CHANGE_STREAM:
+        background_tasks.append(asyncio.create_task(settings_cache.watch_changes()))
+    elif CACHE_REFRESH_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(settings_cache.refresh_periodically(CACHE_REFRESH_INTERVAL)))
+    await search_index.load()
+    if SEARCH_INDEX_REFRESH > 0:
+        background_tasks.append(asyncio.create_task(search_index.refresh_periodically(SEARCH_INDEX_REFRESH)))
+    await set_bot_username(app)
+    background_tasks.append(asyncio.create_task(admin_notifier.run(app.bot)))
+    background_tasks.append(asyncio.create_task(view_counter.run(VIEW_FLUSH_INTERVAL)))
+    await rate_share.start()
+    job_pool.start(app.bot, LOCAL_WORKERS)
+
+
+async def post_stop(app):
+    # The bot is still usable here, so in-flight jobs can be cancelled and handed back cleanly
+    await job_pool.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+
+async def post_shutdown(app):
+    await view_counter.flush()
+    await rate_share.stop()
+    await client.close()
+
+
+# Persistence
+# user_data, chat_data and ConversationHandler states live in MongoDB so a restart doesn't lose a
+# half-finished /gen. PTB hands over changed entries every update_interval; they are queued here and
+# written as one bulk_write per collection. bot_data and callback_data aren't used by this bot.
+class MongoPersistence(BasePersistence):
+    def __init__(self, update_interval: float):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self._collections = {collection.name: collection for collection in (persisted_user_data, persisted_chat_data, conversations)}
+        self._pending = {name: {} for name in self._collections}
+        self._write_task: Optional[asyncio.Task] = None
+
+    def _queue(self, collection, doc_id, request):
+        self._pending[collection.name][doc_id] = request  # Only the latest request per document is kept
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write())
+
+    async def _write(self):
+        # Loops until the queue is drained, so entries queued during a write go out right after it
+        while any(self._pending.values()):
+            for name in list(self._pending):
+                requests, self._pending[name] = self._pending[name], {}
+                if not requests:
+                    continue
+                try:
+                    await self._collections[name].bulk_write(list(requests.values()), ordered=False)
+                except PyMongoError as e:
+                    log_error("persistence_write", e, collection=name, count=len(requests))
+                    # Keep anything newer that was queued meanwhile; retried on the next update or flush
+                    for doc_id, request in requests.items():
+                        self._pending[name].setdefault(doc_id, request)
+                    return
+
+    def _queue_data(self, collection, doc_id: int, data: Dict):
+        # Empty dicts are the default for every user that ever sent an update, so they aren't stored
+        if data:
+            request = UpdateOne({"_id": doc_id}, {"$set": {"data": data, "updated_at": datetime.now()}}, upsert=True)
+        else:
+            request = DeleteOne({"_id": doc_id})
+        self._queue(collection, doc_id, request)
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return {doc["_id"]: doc["data"] async for doc in persisted_user_data.find()}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {doc["_id"]: doc["data"] async for doc in persisted_chat_data.find()}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        # Conversation keys are tuples like (chat_id, user_id); stored as an array next to a string _id
+        return {tuple(doc["key"]): doc["state"] async for doc in conversations.find({"name": name})}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        doc_id = f"{name}:{':'.join(map(str, key))}"
+        if new_state is None:
+            request = DeleteOne({"_id": doc_id})
+        else:
+            request = UpdateOne(
+                {"_id": doc_id},
+                {"$set": {"name": name, "key": list(key), "state": new_state, "updated_at": datetime.now()}},
+                upsert=True
+            )
+        self._queue(conversations, doc_id, request)
+
+    async def update_user_data(self, user_id: int, data: Dict):
+        self._queue_data(persisted_user_data, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        self._queue_data(persisted_chat_data, chat_id, data)
+
+    async def update_bot_data(self, data: Dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._queue(persisted_user_data, user_id, DeleteOne({"_id": user_id}))
+
+    async def drop_chat_data(self, chat_id: int):
+        self._queue(persisted_chat_data, chat_id, DeleteOne({"_id": chat_id}))
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        await self._write()
+
+
+# Update Processing
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Different users run in parallel, updates from the same user run one at a time and in arrival order
+    # (the /gen conversation and the editing_batch_id flow rely on that).
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._queued: Dict[int, int] = {}
+
+    @staticmethod
+    def ordering_key(update) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Take the user's lock before a concurrency slot, so a busy user waits without holding one.
+        # asyncio.Lock is FIFO, which keeps that user's updates in order.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._queued[key] = self._queued.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                del self._queued[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+# Webhook Server
+# Alternative to polling: Telegram (or a local curl with recorded Update JSON) POSTs updates to WEBHOOK_PATH.
+BOT_APP = web.AppKey("bot_app", Application)
+
+# Without the secret anyone who finds WEBHOOK_PATH could post updates "from" OWNER_ID, so there is no
+# unauthenticated mode: run_webhook refuses to start without WEBHOOK_SECRET.
+async def handle_webhook(request: web.Request) -> web.Response:
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+        return web.Response(status=403)
+
+    app = request.app[BOT_APP]
+    try:
+        update = Update.de_json(await request.json(), app.bot)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return web.Response(status=400, text="invalid update")
+
+    await app.update_queue.put(update)
+    return web.Response(text="ok")
+
+
+async def handle_healthz(request: web.Request) -> web.Response:
+    app = request.app[BOT_APP]
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        return web.Response(status=503, text=f"mongodb: {e}")
+    if not app.running:
+        return web.Response(status=503, text="bot not running")
+    return web.Response(text="ok")
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def webhook_server(app) -> web.Application:
+    web_app = web.Application()
+    web_app[BOT_APP] = app
+    web_app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    web_app.router.add_get("/healthz", handle_healthz)
+    web_app.router.add_get("/metrics", handle_metrics)
+    return web_app
+
+
+async def run_webhook(app):
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+    runner = web.AppRunner(webhook_server(app))
+
+    # Mirrors what run_polling does around the update fetching
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    try:
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        logger.info("Webhook server listening", extra={"host": WEBHOOK_HOST, "port": WEBHOOK_PORT, "path": WEBHOOK_PATH})
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+# Worker Mode
+async def run_worker(app):
+    # `python FileShareMongoDB.py worker`: no updates are fetched, the process only drains the jobs collection
+    await app.initialize()
+    await run_migrations()
+    await rate_share.start()
+    job_pool.start(app.bot, WORKER_CONCURRENCY)
+    logger.info("Job worker started", extra={"concurrency": WORKER_CONCURRENCY})
+    try:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        await job_pool.stop()
+        await app.shutdown()
+        await rate_share.stop()
+        await client.close()
+
 
 def main():
-    app = Application.builder().token(BOT_TOKEN).build()
-    app.post_init = set_bot_username
+    log_listener = setup_logging()
+    if sys.argv[1:2] == ["worker"]:
+        app = Application.builder() \
+            .token(BOT_TOKEN) \
+            .request(InstrumentedRequest(connection_pool_size=256)) \
+            .rate_limiter(rate_limiter) \
+            .build()
+        register_runtime_gauges(app)
+        if METRICS_PORT:
+            start_http_server(METRICS_PORT)
+        try:
+            asyncio.run(run_worker(app))
+        finally:
+            log_listener.stop()
+        return
+
+    app = Application.builder() \
+        .token(BOT_TOKEN) \
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES)) \
+        .request(InstrumentedRequest(connection_pool_size=256)) \
+        .rate_limiter(rate_limiter) \
+        .persistence(MongoPersistence(PERSISTENCE_FLUSH_INTERVAL)) \
+        .build()
+    register_runtime_gauges(app)
+    app.post_init = post_init
+    app.post_stop = post_stop
+    app.post_shutdown = post_shutdown
     
     # Admin handlers
-    app.add_handler(CommandHandler("addfsub", add_fsub))
-    app.add_handler(CommandHandler("removefsub", remove_fsub))
-    app.add_handler(CommandHandler("listfsub", list_fsub))
-    app.add_handler(CommandHandler("addadmin", add_admin))
-    app.add_handler(CommandHandler("removeadmin", remove_admin))
-    app.add_handler(CommandHandler("listadmin", list_admin))
-    app.add_handler(CommandHandler("list", list_batches))
-    app.add_handler(CommandHandler("cmd", cmd_list))
-    app.add_handler(CommandHandler("dashboard", dashboard))
+    app.add_handler(CommandHandler("addfsub", instrument(add_fsub)))
+    app.add_handler(CommandHandler("removefsub", instrument(remove_fsub)))
+    app.add_handler(CommandHandler("listfsub", instrument(list_fsub)))
+    app.add_handler(CommandHandler("addadmin", instrument(add_admin)))
+    app.add_handler(CommandHandler("removeadmin", instrument(remove_admin)))
+    app.add_handler(CommandHandler("listadmin", instrument(list_admin)))
+    app.add_handler(CommandHandler("list", instrument(list_batches)))
+    app.add_handler(CommandHandler("cmd", instrument(cmd_list)))
+    app.add_handler(CommandHandler("dashboard", instrument(dashboard)))
+    app.add_handler(CommandHandler("rebuildstats", instrument(rebuild_stats_command)))
+    app.add_handler(CommandHandler("perf", instrument(perf)))
     
     # Gen conversation handler
     gen_handler = ConversationHandler(
-        entry_points=[CommandHandler("gen", gen_start)],
+        entry_points=[CommandHandler("gen", instrument(gen_start))],
         states={
             GEN_WAITING_FILES: [
-                MessageHandler(filters.ALL & ~filters.COMMAND, gen_receive_files),
-                CallbackQueryHandler(gen_done, pattern="^gen_done$")
+                MessageHandler(filters.ALL & ~filters.COMMAND, instrument(gen_receive_files)),
+                CallbackQueryHandler(instrument(gen_done), pattern="^gen_done$")
             ],
-            GEN_WAITING_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, gen_receive_title)]
+            GEN_WAITING_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, instrument(gen_receive_title))]
         },
         fallbacks=[CommandHandler("cancel", lambda u, c: ConversationHandler.END)],
+        name="gen",
+        persistent=True,
         per_message=False,
         per_chat=True,
         per_user=True
@@ -931,11 +3350,13 @@ def main():
     
     # Broadcast conversation handler
     broadcast_handler = ConversationHandler(
-        entry_points=[CommandHandler("broadcast", broadcast_start)],
+        entry_points=[CommandHandler("broadcast", instrument(broadcast_start))],
         states={
-            BROADCAST_WAITING_MESSAGE: [MessageHandler(filters.ALL & ~filters.COMMAND, broadcast_send)]
+            BROADCAST_WAITING_MESSAGE: [MessageHandler(filters.ALL & ~filters.COMMAND, instrument(broadcast_send))]
         },
-        fallbacks=[CommandHandler("cancel", broadcast_cancel)],
+        fallbacks=[CommandHandler("cancel", instrument(broadcast_cancel))],
+        name="broadcast",
+        persistent=True,
         per_message=False,
         per_chat=True,
         per_user=True
@@ -944,11 +3365,13 @@ def main():
     
     # Search conversation handler
     search_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex("^🔍 Search$"), search_start)],
+        entry_points=[MessageHandler(filters.Regex("^🔍 Search$"), instrument(search_start))],
         states={
-            SEARCH_WAITING_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, search_query)]
+            SEARCH_WAITING_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, instrument(search_query))]
         },
         fallbacks=[],
+        name="search",
+        persistent=True,
         per_message=False,
         per_chat=True,
         per_user=True
@@ -956,20 +3379,33 @@ def main():
     app.add_handler(search_handler)
     
     # Callback handlers
-    app.add_handler(CallbackQueryHandler(batch_view, pattern="^batch_view_"))
-    app.add_handler(CallbackQueryHandler(batch_edit, pattern="^batch_edit_"))
-    app.add_handler(CallbackQueryHandler(batch_delete, pattern="^batch_delete_"))
-    app.add_handler(CallbackQueryHandler(batch_list_callback, pattern="^batch_list$"))
-    app.add_handler(CallbackQueryHandler(user_batch_view, pattern="^user_batch_"))
-    app.add_handler(CallbackQueryHandler(check_fsub_callback, pattern="^check_fsub_"))
-    app.add_handler(CallbackQueryHandler(check_browse_callback, pattern="^check_browse$"))
+    app.add_handler(CallbackQueryHandler(instrument(batch_view), pattern="^batch_view_"))
+    app.add_handler(CallbackQueryHandler(instrument(batch_edit), pattern="^batch_edit_"))
+    app.add_handler(CallbackQueryHandler(instrument(batch_delete), pattern="^batch_delete_"))
+    app.add_handler(CallbackQueryHandler(instrument(batch_list_callback), pattern="^batch_list$"))
+    app.add_handler(CallbackQueryHandler(instrument(user_batch_view), pattern="^user_batch_"))
+    app.add_handler(CallbackQueryHandler(instrument(check_fsub_callback), pattern="^check_fsub_"))
+    app.add_handler(CallbackQueryHandler(instrument(check_browse_callback), pattern="^check_browse$"))
+    app.add_handler(CallbackQueryHandler(instrument(search_page_callback), pattern="^search_page_"))
+    app.add_handler(CallbackQueryHandler(instrument(batch_page_callback), pattern="^page_[ua]_[np]_"))
+    app.add_handler(CallbackQueryHandler(instrument(retry_delivery_callback), pattern="^retry_delivery_"))
     
     # User handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    app.add_handler(CommandHandler("start", instrument(start)))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrument(handle_text)))
     
-    print("🤖 Bot started!")
-    app.run_polling()
+    app.add_error_handler(on_error)
+    
+    logger.info("Bot started", extra={"mode": BOT_MODE})
+    if METRICS_PORT and BOT_MODE != "webhook":
+        start_http_server(METRICS_PORT)
+    try:
+        if BOT_MODE == "webhook":
+            asyncio.run(run_webhook(app))
+        else:
+            app.run_polling()
+    finally:
+        log_listener.stop()
 
 
 if __name__ == "__main__":
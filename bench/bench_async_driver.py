@@ -0,0 +1,80 @@
+# Update throughput with concurrent simulated users: the old blocking MongoClient calls made from
+# inside handlers vs the async data-access layer (record_user). Needs a local mongod.
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from pymongo import ASCENDING, MongoClient
+
+from common import BENCH_DB, BENCH_MONGO_URI, LoopLag, bot_module, connect, print_table, use_database
+
+
+def fake_user(user_id: int):
+    return SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Bench", last_name=None)
+
+
+async def run_sync(users, concurrency: int, updates: int) -> tuple:
+    # What /start used to do: find_one, then insert or update, on the event loop thread
+    async def simulated_user(index: int):
+        for update in range(updates):
+            user_id = index * updates + update
+            if users.find_one({"user_id": user_id}):
+                users.update_one({"user_id": user_id}, {"$set": {"last_active": time.time()}})
+            else:
+                users.insert_one({"user_id": user_id, "first_name": "Bench"})
+            await asyncio.sleep(0)
+
+    async with LoopLag() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_user(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, lag.max_lag
+
+
+async def run_async(concurrency: int, updates: int) -> tuple:
+    bot_module.LAST_ACTIVE_INTERVAL = 0  # Every update writes, like the baseline
+
+    async def simulated_user(index: int):
+        for update in range(updates):
+            await bot_module.record_user(fake_user(index * updates + update))
+
+    async with LoopLag() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_user(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, lag.max_lag
+
+
+async def main(args):
+    client = await connect()
+    database = client[BENCH_DB]
+    use_database(database)
+    sync_client = MongoClient(BENCH_MONGO_URI)
+    sync_users = sync_client[BENCH_DB]["users"]
+
+    rows = []
+    for concurrency in args.concurrency:
+        total = concurrency * args.updates
+        for name in ("sync pymongo", "async layer"):
+            await database.drop_collection("users")
+            await database.drop_collection("stats")
+            await database["users"].create_index([("user_id", ASCENDING)], unique=True)
+            bot_module.recently_seen.clear()
+            if name == "sync pymongo":
+                elapsed, lag = await run_sync(sync_users, concurrency, args.updates)
+            else:
+                elapsed, lag = await run_async(concurrency, args.updates)
+            rows.append((name, concurrency, total, f"{total / elapsed:,.0f}", f"{lag * 1000:.1f}"))
+
+    print_table(("driver", "users", "updates", "updates/s", "max loop stall ms"), rows)
+    await client.drop_database(BENCH_DB)
+    await client.close()
+    sync_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-user update throughput, sync vs async driver")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--updates", type=int, default=20, help="updates per simulated user")
+    asyncio.run(main(parser.parse_args()))
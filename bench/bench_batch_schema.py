@@ -0,0 +1,94 @@
+# Bytes transferred by the list/browse queries: batches with embedded files arrays (old schema) vs
+# batches that keep only file_count, with files in batch_files (new schema). Needs a local mongod.
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+
+from common import BENCH_DB, bot_module, connect, print_table, use_database
+
+
+def synthetic_batches(count: int, max_files: int, seed: int = 1):
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    message_id = 0
+    for index in range(count):
+        files = []
+        for _ in range(rng.randint(1, max_files)):
+            message_id += 1
+            files.append({
+                "message_id": message_id,
+                "type": rng.choice(("document", "video", "photo", "audio")),
+                "file_unique_id": f"AgAD{message_id:012d}",
+                "size": rng.randint(10_000, 2_000_000_000)
+            })
+        yield {
+            "_id": ObjectId(),
+            "title": f"Batch {index}",
+            "created_by": 1,
+            "created_at": started + timedelta(minutes=index),
+            "views": rng.randint(0, 10_000)
+        }, files
+
+
+async def measure(query, repeat: int) -> tuple:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        docs = await query()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    return sum(len(bson.encode(doc)) for doc in docs), len(docs), elapsed
+
+
+async def main(args):
+    client = await connect()
+    await client.drop_database(BENCH_DB)
+    database = client[BENCH_DB]
+    use_database(database)
+    legacy = database["legacy_batches"]
+
+    for batch, files in synthetic_batches(args.batches, args.max_files):
+        await legacy.insert_one({**batch, "files": files})
+        await bot_module.batches.insert_one({**batch, "file_count": len(files)})
+        await bot_module.batch_files.insert_many([
+            {"batch_id": batch["_id"], "position": position, **file_data} for position, file_data in enumerate(files)
+        ])
+    await bot_module.migration_3_batch_page_index()
+    await legacy.create_index([("created_at", -1)])
+
+    newest = await bot_module.batches.find_one(sort=[("created_at", -1)])
+    page_size = bot_module.BROWSE_PAGE_SIZE
+    queries = [
+        ("browse / list", "old",
+         lambda: legacy.find().sort("created_at", -1).limit(page_size).to_list(None)),
+        ("browse / list", "new",
+         lambda: bot_module.get_batch_page(None, True, page_size)),
+        ("search (regex, 20)", "old",
+         lambda: legacy.find({"title": {"$regex": "batch 1", "$options": "i"}}).limit(20).to_list(None)),
+        ("search titles (index load)", "new",
+         lambda: bot_module.batches.find({}, {"title": 1, "views": 1}).limit(20).to_list(None)),
+        ("batch view", "old",
+         lambda: legacy.find({"_id": newest["_id"]}).to_list(None)),
+        ("batch view", "new",
+         lambda: bot_module.batches.find({"_id": newest["_id"]}).to_list(None)),
+    ]
+    rows = []
+    for name, schema, query in queries:
+        size, count, elapsed = await measure(query, args.repeat)
+        rows.append((name, schema, count, f"{size:,}", f"{elapsed:.2f}"))
+    print(f"{args.batches:,} batches, up to {args.max_files} files each\n")
+    print_table(("query", "schema", "docs", "BSON bytes returned", "ms"), rows)
+
+    await client.drop_database(BENCH_DB)
+    await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes transferred per list query, embedded vs normalized files")
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--max-files", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
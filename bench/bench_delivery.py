@@ -0,0 +1,75 @@
+# Batch delivery against a fake Bot that enforces a Telegram-style flood limit: the old per-file
+# copy_message loop (errors swallowed) vs deliver_files (copy_messages chunks + RetryAfter handling).
+# No database needed.
+import argparse
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+
+from common import bot_module, print_table
+
+
+class RateLimitedBot:
+    def __init__(self, limit: int, latency: float):
+        self.limit = limit  # Requests per rolling second before RetryAfter
+        self.latency = latency
+        self.calls = 0
+        self.flood_errors = 0
+        self._recent = deque()
+
+    async def _request(self):
+        self.calls += 1
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.limit:
+            self.flood_errors += 1
+            raise RetryAfter(1)
+        self._recent.append(now)
+        await asyncio.sleep(self.latency)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        await self._request()
+        return SimpleNamespace(message_id=message_id)
+
+    async def copy_messages(self, chat_id, from_chat_id, message_ids):
+        await self._request()
+        return [SimpleNamespace(message_id=message_id) for message_id in message_ids]
+
+
+async def per_file_loop(bot, chat_id: int, message_ids) -> int:
+    delivered = 0
+    for message_id in message_ids:
+        try:
+            await bot.copy_message(chat_id=chat_id, from_chat_id=0, message_id=message_id)
+            delivered += 1
+        except Exception:
+            pass
+    return delivered
+
+
+async def main(args):
+    rows = []
+    for files in args.files:
+        message_ids = list(range(1, files + 1))
+        for name in ("per-file loop", "deliver_files"):
+            bot = RateLimitedBot(args.limit, args.latency)
+            started = time.perf_counter()
+            if name == "per-file loop":
+                delivered = await per_file_loop(bot, 42, message_ids)
+            else:
+                delivered = (await bot_module.deliver_files(bot, 42, message_ids))["delivered"]
+            elapsed = time.perf_counter() - started
+            rows.append((name, files, delivered, files - delivered, bot.calls, bot.flood_errors, f"{elapsed:.2f}"))
+    print_table(("engine", "files", "delivered", "lost", "api calls", "429s", "seconds"), rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch delivery against a flood-limited fake Bot")
+    parser.add_argument("--files", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--limit", type=int, default=30, help="requests per second before RetryAfter")
+    parser.add_argument("--latency", type=float, default=0.03, help="seconds per API call")
+    asyncio.run(main(parser.parse_args()))
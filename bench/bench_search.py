@@ -0,0 +1,84 @@
+# Batch title search over synthetic batches: the in-process SearchIndex vs the old unanchored,
+# case-insensitive regex. The regex is timed as a Python scan of all titles and, with --mongo,
+# as the original batches.find({"title": {"$regex": ...}}).limit(20) against a local mongod.
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from common import BENCH_DB, bot_module, connect, print_table
+
+WORDS = (
+    "anime movie series season episode pack collection hd 1080p 720p english subbed dubbed complete "
+    "documentary nature space history music album live concert lecture course python math physics "
+    "chemistry novel comic manga volume chapter extended remastered director cut bonus soundtrack"
+).split()
+QUERIES = ("anime", "season 3", "docu", "manga volume 12", "remastered soundtrack", "nothingmatches")
+
+
+def synthetic_titles(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.sample(WORDS, rng.randint(2, 5)) + [str(rng.randint(1, 50))]).title()
+        for _ in range(count)
+    ]
+
+
+def timed(function, repeat: int) -> tuple:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+async def mongo_regex(titles: list, repeat: int) -> dict:
+    client = await connect()
+    batches = client[BENCH_DB]["batches"]
+    await batches.drop()
+    for start in range(0, len(titles), 10000):
+        await batches.insert_many([{"title": title} for title in titles[start:start + 10000]])
+    timings = {}
+    for query in QUERIES:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await batches.find({"title": {"$regex": query, "$options": "i"}}).limit(20).to_list(None)
+        timings[query] = (time.perf_counter() - started) / repeat * 1000
+    await client.drop_database(BENCH_DB)
+    await client.close()
+    return timings
+
+
+def main(args):
+    titles = synthetic_titles(args.batches)
+
+    index = bot_module.SearchIndex()
+    started = time.perf_counter()
+    for position, title in enumerate(titles):
+        index.add(str(position), title, position % 1000)
+    build = time.perf_counter() - started
+    print(f"{args.batches:,} batches, index built in {build:.2f}s, {len(index._vocabulary):,} tokens\n")
+
+    mongo = asyncio.run(mongo_regex(titles, args.repeat)) if args.mongo else {}
+    rows = []
+    for query in QUERIES:
+        index_ms, results = timed(lambda: index.search(query), args.repeat)
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        regex_ms, matches = timed(lambda: [title for title in titles if pattern.search(title)], args.repeat)
+        row = [query, len(results), f"{index_ms:.2f}", len(matches), f"{regex_ms:.2f}"]
+        if args.mongo:
+            row.append(f"{mongo[query]:.2f}")
+        rows.append(row)
+
+    headers = ["query", "index hits", "index ms", "regex hits", "regex scan ms"]
+    if args.mongo:
+        headers.append("mongo $regex ms")
+    print_table(headers, rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SearchIndex vs regex title search")
+    parser.add_argument("--batches", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true", help="also time $regex on a local mongod (BENCH_MONGO_URI)")
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+# Shared setup for the benchmarks. Each bench is a standalone script:
+#   python bench/bench_<name>.py [--help]
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+from pymongo import AsyncMongoClient  # noqa: E402
+
+import FileShareMongoDB as bot_module  # noqa: E402
+
+BENCH_MONGO_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DB = "file_sharing_bot_bench"
+COLLECTIONS = (
+    "fsub_channels", "admins", "batches", "batch_files", "users", "broadcasts", "deliveries", "jobs",
+    "stored_files", "meta", "stats", "stats_daily", "batch_views_daily"
+)
+
+
+async def connect() -> AsyncMongoClient:
+    client = AsyncMongoClient(BENCH_MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        sys.exit(f"No MongoDB at {BENCH_MONGO_URI} ({type(e).__name__}); set BENCH_MONGO_URI to a local mongod")
+    return client
+
+
+def use_database(database):
+    # Points the bot's collection globals at the scratch database
+    for name in COLLECTIONS:
+        collection = database["files" if name == "stored_files" else name]
+        setattr(bot_module, name, collection)
+    bot_module.db = database
+
+
+class LoopLag:
+    # Measures how long the event loop was blocked while the benchmark ran
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _probe(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - started - self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._probe())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in (headers, *rows):
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,51 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+import pytest
+
+# The bot is a single module at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+from pymongo import AsyncMongoClient, MongoClient  # noqa: E402
+from pymongo.asynchronous.collection import AsyncCollection  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+
+import FileShareMongoDB as bot_module  # noqa: E402
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    # Yields an async context manager that opens a scratch database and points the bot's collection
+    # globals at it. The client is opened inside the test's event loop. Skipped without a server.
+    admin = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        admin.admin.command("ping")
+    except PyMongoError:
+        admin.close()
+        pytest.skip(f"no MongoDB at {MONGO_TEST_URI}")
+    name = f"fileshare_test_{uuid4().hex[:8]}"
+    collections = {
+        attr: value.name for attr, value in vars(bot_module).items()
+        if isinstance(value, AsyncCollection) and value.database.name == bot_module.DB_NAME
+    }
+
+    @asynccontextmanager
+    async def connect():
+        client = AsyncMongoClient(MONGO_TEST_URI)
+        database = client[name]
+        monkeypatch.setattr(bot_module, "db", database)
+        for attr, collection_name in collections.items():
+            monkeypatch.setattr(bot_module, attr, database[collection_name])
+        try:
+            yield database
+        finally:
+            await client.close()
+
+    yield connect
+    admin.drop_database(name)
+    admin.close()
@@ -0,0 +1,44 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import FileShareMongoDB as bot_module
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def open_link(monkeypatch, batch_id, lookup=None):
+    async def nobody_missing(bot, user_id):
+        return []
+
+    monkeypatch.setattr(bot_module.fsub_checker, "not_joined", nobody_missing)
+    if lookup:
+        monkeypatch.setattr(bot_module, "get_cached_batch", lookup)
+    errors = []
+    monkeypatch.setattr(bot_module, "log_error", lambda where, error, **fields: errors.append((where, error)))
+    message = FakeMessage()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=7), message=message)
+    asyncio.run(bot_module.send_batch_files(update, SimpleNamespace(bot=None), batch_id))
+    return message.replies, errors
+
+
+def test_malformed_link_is_reported_as_invalid(monkeypatch):
+    replies, errors = open_link(monkeypatch, "not-an-object-id")
+    assert replies == ["❌ Invalid batch link."]
+    assert errors == []
+
+
+def test_database_error_is_logged_not_blamed_on_the_link(monkeypatch):
+    async def unavailable(batch_id):
+        raise ServerSelectionTimeoutError("no servers")
+
+    replies, errors = open_link(monkeypatch, "65a000000000000000000000", unavailable)
+    assert replies == [bot_module.ERROR_REPLY]
+    assert [(where, type(error)) for where, error in errors] == [("send_batch", ServerSelectionTimeoutError)]
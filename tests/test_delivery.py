@@ -0,0 +1,83 @@
+import asyncio
+import copy
+from types import SimpleNamespace
+
+from telegram.error import BadRequest, Forbidden
+
+from FileShareMongoDB import deliver_files
+
+
+class FakeBot:
+    def __init__(self, bulk_error=None, single_errors=None):
+        self.bulk_error = bulk_error
+        self.single_errors = single_errors or {}  # message_id -> exception
+        self.bulk_calls = 0
+        self.single_calls = 0
+        self.copied = []
+
+    async def copy_messages(self, chat_id, from_chat_id, message_ids):
+        self.bulk_calls += 1
+        self.copied.extend(message_ids)
+        if self.bulk_error:
+            raise self.bulk_error
+        return [SimpleNamespace(message_id=message_id) for message_id in message_ids]
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        self.single_calls += 1
+        if message_id in self.single_errors:
+            raise self.single_errors[message_id]
+        return SimpleNamespace(message_id=message_id)
+
+
+def test_bulk_copy_in_chunks():
+    bot = FakeBot()
+    result = asyncio.run(deliver_files(bot, 42, list(range(1, 251))))
+    assert result["delivered"] == 250
+    assert bot.bulk_calls == 3
+    assert bot.single_calls == 0
+
+
+def test_message_error_falls_back_to_single_copies():
+    bot = FakeBot(bulk_error=BadRequest("Message to copy not found"), single_errors={3: BadRequest("Message to copy not found")})
+    result = asyncio.run(deliver_files(bot, 42, [1, 2, 3, 4]))
+    assert result["delivered"] == 3
+    assert result["failed_message_ids"] == [3]
+    assert bot.single_calls == 4
+
+
+def test_blocked_user_stops_delivery():
+    bot = FakeBot(bulk_error=Forbidden("Forbidden: bot was blocked by the user"))
+    result = asyncio.run(deliver_files(bot, 42, list(range(1, 1001))))
+    assert result["delivered"] == 0
+    assert len(result["failed_message_ids"]) == 1000
+    assert bot.bulk_calls == 1
+    assert bot.single_calls == 0
+
+
+def test_chat_error_during_fallback_stops_delivery():
+    bot = FakeBot(bulk_error=BadRequest("Message to copy not found"), single_errors={2: BadRequest("Chat not found")})
+    result = asyncio.run(deliver_files(bot, 42, list(range(1, 301))))
+    assert result["delivered"] == 1
+    assert len(result["failed_message_ids"]) == 299
+    assert bot.single_calls == 2
+
+
+def test_resume_from_checkpoint_skips_delivered_chunks():
+    bot = FakeBot()
+    message_ids = list(range(1, 251))
+    saved = []
+
+    async def crash_after_two_chunks(progress):
+        saved.append(copy.deepcopy(progress))
+        if len(saved) == 2:
+            raise RuntimeError("worker died")
+
+    try:
+        asyncio.run(deliver_files(bot, 42, message_ids, checkpoint=crash_after_two_chunks))
+    except RuntimeError:
+        pass
+    progress = saved[-1]
+    result = asyncio.run(deliver_files(bot, 42, message_ids[progress["total"]:], progress))
+    assert result["delivered"] == 250
+    assert result["total"] == 250
+    assert bot.copied == message_ids
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import FileIngestor
+
+
+class FakeBot:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.forwarded = []
+        self._next_id = 1000
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids):
+        await asyncio.sleep(self.delay)
+        self.forwarded.extend(message_ids)
+        stored = []
+        for _ in message_ids:
+            self._next_id += 1
+            stored.append(SimpleNamespace(message_id=self._next_id))
+        return stored
+
+
+def document(message_id: int):
+    media = SimpleNamespace(file_unique_id=f"file{message_id}", file_size=1)
+    fields = {media_type: None for media_type in bot_module.MEDIA_TYPES}
+    return SimpleNamespace(chat_id=42, message_id=message_id, text=None, **{**fields, "document": media})
+
+
+def new_session():
+    return {"batch_files": [], "file_counts": {}, "ingest_failed": 0}
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    known = {}
+
+    async def find_stored_files(file_unique_ids):
+        return {file_unique_id: known[file_unique_id] for file_unique_id in file_unique_ids if file_unique_id in known}
+
+    async def register_stored_files(files):
+        for file_data in files:
+            known.setdefault(file_data["file_unique_id"], {"message_id": file_data["message_id"]})
+
+    monkeypatch.setattr(bot_module, "find_stored_files", find_stored_files)
+    monkeypatch.setattr(bot_module, "register_stored_files", register_stored_files)
+    return known
+
+
+def test_burst_is_forwarded_in_one_call(storage):
+    bot = FakeBot()
+    user_data = new_session()
+
+    async def scenario():
+        ingestor = FileIngestor(delay=0.01)
+        for message_id in (3, 1, 2):
+            ingestor.add(bot, 7, user_data, document(message_id))
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert bot.forwarded == [1, 2, 3]
+    assert [file_data["file_unique_id"] for file_data in user_data["batch_files"]] == ["file1", "file2", "file3"]
+
+
+def test_failed_flush_counts_files_as_failed(storage, monkeypatch):
+    async def broken(file_unique_ids):
+        raise AutoReconnect("primary stepped down")
+
+    monkeypatch.setattr(bot_module, "find_stored_files", broken)
+    user_data = new_session()
+
+    async def scenario():
+        ingestor = FileIngestor(delay=0.01)
+        for message_id in (1, 2):
+            ingestor.add(FakeBot(), 7, user_data, document(message_id))
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert user_data["batch_files"] == []
+    assert user_data["ingest_failed"] == 2
+
+
+def test_discard_stops_flush_in_flight(storage):
+    bot = FakeBot(delay=0.1)
+    user_data = new_session()
+
+    async def scenario():
+        ingestor = FileIngestor(delay=0.01)
+        ingestor.add(bot, 7, user_data, document(1))
+        await asyncio.sleep(0.03)  # The timer fired and the forward is in flight
+        # What gen_start does for a fresh /gen
+        await ingestor.discard(7)
+        user_data.update(new_session())
+        await asyncio.sleep(0.15)
+
+    asyncio.run(scenario())
+    assert user_data["batch_files"] == []
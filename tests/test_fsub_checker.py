@@ -0,0 +1,121 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import FSubChecker
+
+
+class FakeBot:
+    def __init__(self, statuses, delay=0.05):
+        self.statuses = statuses  # channel_id -> member status, or an exception to raise
+        self.delay = delay
+        self.member_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.export_calls = 0
+
+    async def get_chat_member(self, channel_id, user_id):
+        self.member_calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        status = self.statuses[channel_id]
+        if isinstance(status, Exception):
+            raise status
+        return SimpleNamespace(status=status)
+
+    async def get_chat(self, channel_id):
+        return SimpleNamespace(title=f"Channel {channel_id}", username=None, invite_link=None)
+
+    async def export_chat_invite_link(self, channel_id):
+        self.export_calls += 1
+        return f"https://t.me/+invite{channel_id}"
+
+
+@pytest.fixture
+def channels(monkeypatch):
+    def use(channel_ids):
+        monkeypatch.setattr(bot_module.settings_cache, "fsub_channels", list(channel_ids))
+    return use
+
+
+def test_membership_checked_concurrently(channels):
+    channels([-1001, -1002, -1003, -1004])
+    bot = FakeBot({-1001: "member", -1002: "administrator", -1003: "left", -1004: "member"})
+    checker = FSubChecker(member_ttl=60, info_ttl=60)
+
+    not_joined = asyncio.run(checker.not_joined(bot, 42))
+
+    assert not_joined == [-1003]
+    assert bot.member_calls == 4
+    assert bot.max_in_flight == 4
+
+
+def test_positive_results_cached_until_ttl(channels):
+    channels([-1001, -1002])
+    bot = FakeBot({-1001: "member", -1002: "left"}, delay=0)
+    checker = FSubChecker(member_ttl=0.2, info_ttl=60)
+
+    async def scenario():
+        assert await checker.not_joined(bot, 42) == [-1002]
+        assert bot.member_calls == 2
+        # Only the joined channel is served from the cache; "left" is asked again
+        assert await checker.not_joined(bot, 42) == [-1002]
+        assert bot.member_calls == 3
+        await asyncio.sleep(0.25)
+        assert await checker.not_joined(bot, 42) == [-1002]
+        assert bot.member_calls == 5
+
+    asyncio.run(scenario())
+
+
+def test_invite_link_exported_once(channels):
+    bot = FakeBot({}, delay=0)
+    checker = FSubChecker(member_ttl=60, info_ttl=60)
+
+    async def scenario():
+        first = await checker.join_keyboard(bot, [-1001], "check_fsub_x")
+        second = await checker.join_keyboard(bot, [-1001], "check_fsub_x")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert bot.export_calls == 1
+    assert first.inline_keyboard[0][0].url == second.inline_keyboard[0][0].url == "https://t.me/+invite-1001"
+
+
+@pytest.mark.parametrize("fail_open", [False, True])
+def test_transient_errors_follow_fail_mode(channels, fail_open):
+    channels([-1001, -1002])
+    bot = FakeBot({-1001: NetworkError("timed out"), -1002: BadRequest("User not found")}, delay=0)
+    checker = FSubChecker(member_ttl=60, info_ttl=60, fail_open=fail_open)
+
+    async def scenario():
+        expected = [-1002] if fail_open else [-1001, -1002]
+        assert await checker.not_joined(bot, 42) == expected
+        # The network error's answer wasn't cached
+        await checker.not_joined(bot, 42)
+        assert bot.member_calls == 4
+
+    asyncio.run(scenario())
+
+
+def test_slow_lookup_is_bounded_to_one_attempt(channels):
+    channels([-1001])
+    bot = FakeBot({-1001: RetryAfter(30)}, delay=1)
+    checker = FSubChecker(member_ttl=60, info_ttl=60, check_timeout=0.05)
+
+    started = time.monotonic()
+    assert asyncio.run(checker.not_joined(bot, 42)) == [-1001]
+    assert time.monotonic() - started < 0.5
+    assert bot.member_calls == 1
+
+    bot = FakeBot({-1001: RetryAfter(30)}, delay=0)
+    assert asyncio.run(checker.not_joined(bot, 42)) == [-1001]
+    assert bot.member_calls == 1
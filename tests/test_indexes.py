@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+
+from pymongo import DESCENDING
+
+import FileShareMongoDB as bot_module
+
+
+def plan_indexes(explain: dict) -> tuple:
+    # Collects the stages and index names of the winning plan, whatever the server's plan layout
+    stages, indexes = set(), set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.add(node["stage"])
+            if "indexName" in node:
+                indexes.add(node["indexName"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(explain["queryPlanner"]["winningPlan"])
+    return stages, indexes
+
+
+def test_queries_use_indexes(mongo):
+    async def scenario():
+        async with mongo():
+            await bot_module.run_migrations()
+            await bot_module.users.insert_many([
+                {"user_id": user_id, "inactive": user_id % 3 == 0} for user_id in range(200)
+            ])
+            await bot_module.admins.insert_many([{"user_id": user_id} for user_id in range(20)])
+            await bot_module.fsub_channels.insert_many([{"channel_id": -1000 - index} for index in range(20)])
+            await bot_module.batches.insert_many([
+                {"title": f"Batch {index}", "created_at": datetime(2024, 1, 1 + index % 28), "file_count": 1}
+                for index in range(200)
+            ])
+
+            newest = [("created_at", DESCENDING), ("_id", DESCENDING)]
+            checkpoint = (await bot_module.users.find_one({}, sort=[("_id", 1)]))["_id"]
+            broadcast_page = {**bot_module.ACTIVE_USERS, "_id": {"$gt": checkpoint}}
+            return {
+                "broadcast": await bot_module.users.find(broadcast_page, {"user_id": 1}).sort("_id", 1).explain(),
+                "users": await bot_module.users.find({"user_id": 7}).explain(),
+                "admins": await bot_module.admins.find({"user_id": 7}).explain(),
+                "fsub_channels": await bot_module.fsub_channels.find({"channel_id": -1005}).explain(),
+                "batches": await bot_module.batches.find({}).sort(newest).limit(20).explain(),
+            }
+
+    plans = asyncio.run(scenario())
+    expected = {
+        "broadcast": "inactive_1__id_1",
+        "users": "user_id_1",
+        "admins": "user_id_1",
+        "fsub_channels": "channel_id_1",
+        "batches": "created_at_-1__id_-1",
+    }
+    for collection, index_name in expected.items():
+        stages, indexes = plan_indexes(plans[collection])
+        assert "COLLSCAN" not in stages, collection
+        assert "SORT" not in stages, collection
+        assert index_name in indexes, collection
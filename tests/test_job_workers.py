@@ -0,0 +1,118 @@
+import asyncio
+from datetime import timedelta
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import JobWorker
+
+
+def run_workers(monkeypatch, handler, scenario, count=3):
+    # Runs `count` JobWorkers against the scratch jobs collection while scenario() drives the queue
+    async def main():
+        monkeypatch.setattr(bot_module, "jobs_available", asyncio.Event())
+        monkeypatch.setattr(bot_module, "JOB_POLL_INTERVAL", 0.05)
+        monkeypatch.setitem(bot_module.JOB_HANDLERS, "test", handler)
+        await bot_module.run_migrations()
+        workers = [JobWorker(None, f"test:{index}") for index in range(count)]
+        tasks = [asyncio.create_task(worker.run()) for worker in workers]
+        try:
+            return await scenario()
+        finally:
+            for worker in workers:
+                worker.stop()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return main()
+
+
+async def wait_until_finished(count: int):
+    for _ in range(200):
+        if await bot_module.jobs.count_documents({"status": {"$in": ["done", "failed"]}}) >= count:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("jobs didn't finish")
+
+
+def test_each_job_is_claimed_once(mongo, monkeypatch):
+    runs = []
+
+    async def handler(bot, job, checkpoint):
+        runs.append(job["payload"]["n"])
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        for n in range(30):
+            await bot_module.enqueue_job("test", {"n": n})
+        await wait_until_finished(30)
+        return await bot_module.jobs.distinct("worker")
+
+    async def main():
+        async with mongo():
+            return await run_workers(monkeypatch, handler, scenario)
+
+    workers = asyncio.run(main())
+    assert sorted(runs) == list(range(30))
+    assert len(workers) > 1
+
+
+def test_lapsed_lease_is_taken_over_and_resumes(mongo, monkeypatch):
+    seen = []
+
+    async def handler(bot, job, checkpoint):
+        seen.append((job["worker"], job["attempts"], job.get("progress")))
+
+    async def scenario():
+        # A job whose worker died after checkpointing three files
+        now = bot_module.utc_now()
+        await bot_module.jobs.insert_one({
+            "type": "test", "payload": {}, "status": "running", "attempts": 1,
+            "worker": "dead:0", "lease_until": now - timedelta(seconds=1), "run_at": now,
+            "progress": {"total": 3, "delivered": 3, "skipped": 0, "failed_message_ids": []}
+        })
+        bot_module.jobs_available.set()
+        await wait_until_finished(1)
+        return await bot_module.jobs.find_one({})
+
+    async def main():
+        async with mongo():
+            return await run_workers(monkeypatch, handler, scenario)
+
+    job = asyncio.run(main())
+    assert len(seen) == 1
+    worker, attempts, progress = seen[0]
+    assert worker != "dead:0"
+    assert attempts == 2
+    assert progress["total"] == 3
+    assert job["status"] == "done"
+
+
+def test_failing_job_is_retried_until_max_attempts(mongo, monkeypatch):
+    monkeypatch.setattr(bot_module, "JOB_MAX_ATTEMPTS", 3)
+    attempts, backoffs = [], []
+
+    async def handler(bot, job, checkpoint):
+        attempts.append(job["attempts"])
+        raise RuntimeError("boom")
+
+    async def scenario():
+        job_id = await bot_module.enqueue_job("test", {})
+        for _ in range(200):
+            job = await bot_module.jobs.find_one({"_id": job_id})
+            if job["status"] == "failed":
+                return job
+            if job["status"] == "queued" and job["run_at"] > bot_module.utc_now().replace(tzinfo=None):
+                # fail_job backed it off into the future; skip the wait
+                backoffs.append(job["attempts"])
+                await bot_module.jobs.update_one({"_id": job_id}, {"$set": {"run_at": bot_module.utc_now()}})
+                bot_module.jobs_available.set()
+            await asyncio.sleep(0.05)
+        raise AssertionError("job never failed")
+
+    async def main():
+        async with mongo():
+            return await run_workers(monkeypatch, handler, scenario, count=2)
+
+    job = asyncio.run(main())
+    assert attempts == [1, 2, 3]
+    assert backoffs == [1, 2]
+    assert job["attempts"] == 3
+    assert job["error"] == "RuntimeError: boom"
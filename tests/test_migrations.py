@@ -0,0 +1,21 @@
+import asyncio
+
+import FileShareMongoDB as bot_module
+
+
+def test_concurrent_startups_apply_migrations_once(mongo):
+    async def scenario():
+        async with mongo():
+            broadcast_id = (await bot_module.broadcasts.insert_one({"status": "running"})).inserted_id
+            # The bot and several workers starting against a fresh database at the same time
+            await asyncio.gather(*(bot_module.run_migrations() for _ in range(4)))
+            return (
+                await bot_module.get_schema_version(),
+                await bot_module.jobs.count_documents({"type": "broadcast", "payload.broadcast_id": broadcast_id}),
+                await bot_module.meta.find_one({"_id": "migration_lock"}),
+            )
+
+    version, broadcast_jobs, lock = asyncio.run(scenario())
+    assert version == bot_module.MIGRATIONS[-1][0]
+    assert broadcast_jobs == 1
+    assert lock is None
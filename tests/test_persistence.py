@@ -0,0 +1,129 @@
+import asyncio
+import copy
+
+import bson
+import pytest
+from pymongo import DeleteOne, UpdateOne
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import GEN_WAITING_FILES, GEN_WAITING_TITLE, MongoPersistence
+
+
+class MemoryCollection:
+    # Just enough of a collection for MongoPersistence: find() and bulk_write of UpdateOne($set)/DeleteOne
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = {}
+
+    async def _iterate(self, query):
+        for doc in list(self.docs.values()):
+            if all(doc.get(key) == value for key, value in query.items()):
+                yield copy.deepcopy(doc)
+
+    def find(self, query=None):
+        return self._iterate(query or {})
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            doc_id = request._filter["_id"]
+            if isinstance(request, DeleteOne):
+                self.docs.pop(doc_id, None)
+            elif isinstance(request, UpdateOne):
+                # Round-trip through BSON so unencodable state fails here like it would against MongoDB
+                fields = bson.decode(bson.encode(request._doc["$set"]))
+                self.docs.setdefault(doc_id, {"_id": doc_id}).update(fields)
+
+
+class MemoryDatabase(dict):
+    def __missing__(self, name):
+        self[name] = MemoryCollection(name)
+        return self[name]
+
+
+@pytest.fixture(params=["memory", "mongod"])
+def storage(request, monkeypatch):
+    # Runs each test against the in-memory stand-in and, when one is available, a real mongod
+    if request.param == "mongod":
+        return request.getfixturevalue("mongo")
+
+    database = MemoryDatabase()
+
+    class Connect:
+        async def __aenter__(self):
+            monkeypatch.setattr(bot_module, "db", database)
+            for attr in ("persisted_user_data", "persisted_chat_data", "conversations"):
+                monkeypatch.setattr(bot_module, attr, database[getattr(bot_module, attr).name])
+            return database
+
+        async def __aexit__(self, *exc):
+            pass
+
+    return Connect
+
+
+def test_gen_state_survives_restart(storage):
+    batch_files = [
+        {"message_id": 101, "type": "document", "file_unique_id": "AgAD1", "size": 1024},
+        {"message_id": 102, "type": "video", "file_unique_id": "AgAD2", "size": 2048},
+    ]
+    gen_session = {"batch_files": batch_files, "file_counts": {"document": 1, "video": 1}, "ingest_failed": 0}
+
+    async def scenario():
+        async with storage():
+            # First process: what Application.update_persistence hands over mid-/gen, then shutdown
+            before = MongoPersistence(update_interval=60)
+            await before.update_user_data(7, gen_session)
+            await before.update_user_data(8, {})
+            await before.update_chat_data(7, {"note": "kept"})
+            await before.update_conversation("gen", (7, 7), GEN_WAITING_FILES)
+            await before.update_conversation("search", (9, 9), 2)
+            await before.update_conversation("search", (9, 9), None)
+            await before.flush()
+
+            # Restart: a fresh instance loads what the first one wrote
+            after = MongoPersistence(update_interval=60)
+            user_data = await after.get_user_data()
+            chat_data = await after.get_chat_data()
+            gen = await after.get_conversations("gen")
+            search = await after.get_conversations("search")
+
+            # The conversation moves on and ends after the restart
+            await after.update_conversation("gen", (7, 7), GEN_WAITING_TITLE)
+            await after.flush()
+            moved_on = await MongoPersistence(update_interval=60).get_conversations("gen")
+            await after.update_conversation("gen", (7, 7), None)
+            await after.drop_user_data(7)
+            await after.flush()
+            final = MongoPersistence(update_interval=60)
+            return user_data, chat_data, gen, search, moved_on, await final.get_conversations("gen"), await final.get_user_data()
+
+    user_data, chat_data, gen, search, moved_on, ended, dropped = asyncio.run(scenario())
+    assert user_data == {7: gen_session}
+    assert chat_data == {7: {"note": "kept"}}
+    assert gen == {(7, 7): GEN_WAITING_FILES}
+    assert search == {}
+    assert moved_on == {(7, 7): GEN_WAITING_TITLE}
+    assert ended == {}
+    assert dropped == {}
+
+
+def test_writes_are_batched(storage, monkeypatch):
+    async def scenario():
+        async with storage() as database:
+            collection = database[bot_module.persisted_user_data.name]
+            calls = []
+            original = collection.bulk_write
+
+            async def counting_bulk_write(requests, ordered=True):
+                calls.append(len(requests))
+                return await original(requests, ordered=ordered)
+
+            monkeypatch.setattr(collection, "bulk_write", counting_bulk_write)
+            persistence = MongoPersistence(update_interval=60)
+            await asyncio.gather(*(persistence.update_user_data(user_id, {"n": user_id}) for user_id in range(1, 51)))
+            await persistence.flush()
+            return calls
+
+    calls = asyncio.run(scenario())
+    assert sum(calls) == 50
+    assert len(calls) <= 2
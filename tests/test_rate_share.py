@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import PRIORITY_BROADCAST, PRIORITY_INTERACTIVE, PriorityRateLimiter, RateShare
+
+
+def test_take_demand_reports_most_urgent_priority():
+    async def scenario():
+        limiter = PriorityRateLimiter(rate=1000, chat_rate=1, chat_burst=10)
+        await limiter._acquire(PRIORITY_BROADCAST)
+        await limiter._acquire(PRIORITY_INTERACTIVE)
+        first = limiter.take_demand()
+        second = limiter.take_demand()
+        await limiter.shutdown()
+        return first, second
+
+    assert asyncio.run(scenario()) == (PRIORITY_INTERACTIVE, None)
+
+
+def test_group_cap_skips_unlimited_chats():
+    async def scenario():
+        limiter = PriorityRateLimiter(rate=1000, chat_rate=1, chat_burst=10, unlimited_chats=(-1001,))
+
+        async def send(**kwargs):
+            return True
+
+        started = time.monotonic()
+        for _ in range(30):
+            await limiter.process_request(send, (), {}, "forwardMessage", {"chat_id": -1001}, None)
+        storage_elapsed = time.monotonic() - started
+        # An ordinary group gets 20 back to back, then one per three seconds
+        capped = asyncio.gather(*(
+            limiter.process_request(send, (), {}, "sendMessage", {"chat_id": -1002}, None) for _ in range(21)
+        ))
+        await asyncio.sleep(0.2)
+        group_done = capped.done()
+        capped.cancel()
+        await asyncio.gather(capped, return_exceptions=True)
+        await limiter.shutdown()
+        return storage_elapsed, group_done
+
+    storage_elapsed, group_done = asyncio.run(scenario())
+    assert storage_elapsed < 0.5
+    assert not group_done
+
+
+def test_processes_split_the_budget(mongo, monkeypatch):
+    async def scenario():
+        async with mongo():
+            await bot_module.run_migrations()
+            bot_limiter = PriorityRateLimiter(rate=30, chat_rate=1, chat_burst=10)
+            worker_limiter = PriorityRateLimiter(rate=30, chat_rate=1, chat_burst=10)
+            bot_share = RateShare(bot_limiter, 30, interval=60)
+            worker_share = RateShare(worker_limiter, 30, interval=60)
+
+            # The bot process answers users; the worker only broadcasts and hits a flood wait
+            bot_limiter._demand = PRIORITY_INTERACTIVE
+            worker_limiter._demand = PRIORITY_BROADCAST
+            worker_limiter.pause(30)
+            monkeypatch.setattr(bot_module, "PROCESS_ID", "bot")
+            await bot_share.sync()
+            monkeypatch.setattr(bot_module, "PROCESS_ID", "worker")
+            await worker_share.sync()
+            monkeypatch.setattr(bot_module, "PROCESS_ID", "bot")
+            bot_limiter._demand = PRIORITY_INTERACTIVE
+            await bot_share.sync()
+
+            await bot_share.stop()
+            remaining = await bot_module.rate_shares.count_documents({})
+            return bot_limiter, worker_limiter, remaining
+
+    bot_limiter, worker_limiter, remaining = asyncio.run(scenario())
+    assert bot_limiter.rate == 24
+    assert worker_limiter.rate == 6
+    assert bot_limiter.paused_for() > 20
+    assert remaining == 1
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import FileShareMongoDB as bot_module
+
+
+class FakeUsers:
+    # user_id -> document; enough of a collection for record_user and reactivate_user
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        previous = self.docs.get(query["user_id"])
+        before = dict(previous) if previous else None
+        self.docs.setdefault(query["user_id"], {"user_id": query["user_id"]}).update(update["$set"])
+        return before
+
+    async def update_one(self, query, update):
+        doc = self.docs.get(query["user_id"])
+        matched = doc is not None and all(doc.get(key) == value for key, value in query.items())
+        if matched:
+            doc.update(update["$set"])
+        return SimpleNamespace(matched_count=int(matched), modified_count=int(matched))
+
+
+def test_returning_user_is_reactivated_inside_coalescing_window(monkeypatch):
+    users = FakeUsers()
+    bumps = []
+
+    async def bump_stats(counters, daily=None):
+        bumps.append(counters)
+
+    monkeypatch.setattr(bot_module, "users", users)
+    monkeypatch.setattr(bot_module, "bump_stats", bump_stats)
+    monkeypatch.setattr(bot_module, "recently_seen", {})
+    user = SimpleNamespace(id=7, username="u", first_name="U", last_name=None)
+
+    async def scenario():
+        assert await bot_module.record_user(user) is True
+        # A broadcast finds they blocked the bot, then they unblock and /start again right away
+        users.docs[7]["inactive"] = True
+        assert await bot_module.record_user(user) is False
+        await bot_module.record_user(user)
+
+    asyncio.run(scenario())
+    assert users.docs[7]["inactive"] is False
+    assert bumps == [{"users": 1}, {"inactive_users": -1}]
@@ -0,0 +1,66 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from FileShareMongoDB import PerUserUpdateProcessor
+
+
+def synthetic_update(update_id: int, user_id: int) -> Update:
+    return Update(update_id, message=Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(user_id, Chat.PRIVATE),
+        from_user=User(user_id, f"user{user_id}", False),
+        text=f"update {update_id}"
+    ))
+
+
+def test_replay_keeps_per_user_order_and_runs_users_in_parallel():
+    users, per_user, limit, work = 50, 20, 16, 0.005
+    rng = random.Random(7)
+    # Interleave the users' updates randomly while keeping each user's own sequence
+    arrivals = [user_id for user_id in range(1, users + 1) for _ in range(per_user)]
+    rng.shuffle(arrivals)
+
+    completed = {user_id: [] for user_id in range(1, users + 1)}
+    running = {"total": 0, "max_total": 0, "per_user": {}}
+    overlaps = []
+
+    async def handle(user_id: int, sequence: int):
+        running["total"] += 1
+        running["max_total"] = max(running["max_total"], running["total"])
+        running["per_user"][user_id] = running["per_user"].get(user_id, 0) + 1
+        if running["per_user"][user_id] > 1:
+            overlaps.append(user_id)
+        await asyncio.sleep(rng.uniform(0, work * 2))
+        running["per_user"][user_id] -= 1
+        running["total"] -= 1
+        completed[user_id].append(sequence)
+
+    async def replay():
+        processor = PerUserUpdateProcessor(limit)
+        await processor.initialize()
+        sequences = {}
+        tasks = []
+        for update_id, user_id in enumerate(arrivals):
+            sequence = sequences[user_id] = sequences.get(user_id, -1) + 1
+            update = synthetic_update(update_id, user_id)
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(user_id, sequence))))
+        await asyncio.gather(*tasks)
+        await processor.shutdown()
+        return processor
+
+    started = time.perf_counter()
+    processor = asyncio.run(replay())
+    elapsed = time.perf_counter() - started
+
+    assert overlaps == []
+    assert all(sequence == list(range(per_user)) for sequence in completed.values())
+    assert 1 < running["max_total"] <= limit
+    # Serial processing would take about users * per_user * work seconds
+    assert elapsed < users * per_user * work / 2
+    # Per-user locks are released once a user's queue drains
+    assert processor._locks == {} and processor._queued == {}
@@ -0,0 +1,73 @@
+import asyncio
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import FileShareMongoDB as bot_module
+from FileShareMongoDB import ViewCounter
+
+
+def fake_writes(monkeypatch, failures):
+    # Records what each VIEW_WRITES step applied; failures maps a step to the errors its next calls raise
+    applied = {step: {} for step in bot_module.VIEW_WRITES}
+
+    def step_writer(step):
+        async def write(increments):
+            if failures.get(step):
+                error = failures[step].pop(0)
+                if isinstance(error, BulkWriteError):
+                    # The writes that weren't reported as failed did land
+                    failed = {error_doc["index"] for error_doc in error.details["writeErrors"]}
+                    increments = {key: count for index, (key, count) in enumerate(increments.items()) if index not in failed}
+                    for key, count in increments.items():
+                        applied[step][key] = applied[step].get(key, 0) + count
+                raise error
+            for key, count in increments.items():
+                applied[step][key] = applied[step].get(key, 0) + count
+        return write
+
+    for step in bot_module.VIEW_WRITES:
+        monkeypatch.setitem(bot_module.VIEW_WRITES, step, step_writer(step))
+    monkeypatch.setattr(bot_module, "VIEW_DAILY_BUCKETS", 1)
+    monkeypatch.setattr(bot_module, "log_error", lambda *args, **kwargs: None)
+    return applied
+
+
+def test_failed_daily_write_does_not_repeat_batch_increments(monkeypatch):
+    applied = fake_writes(monkeypatch, {"daily": [AutoReconnect("primary stepped down")]})
+    counter = ViewCounter()
+    batch = ObjectId()
+    day = bot_module.today()
+
+    async def scenario():
+        for _ in range(3):
+            counter.add(batch)
+        await counter.flush()
+        assert applied["batches"] == {batch: 3}
+        assert applied["daily"] == {}
+        assert counter.pending(batch) == 0
+        await counter.flush()
+
+    asyncio.run(scenario())
+    assert applied == {"batches": {batch: 3}, "daily": {(batch, day): 3}, "stats": {"views": 3}}
+
+
+def test_partial_bulk_write_requeues_only_failed_writes(monkeypatch):
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "boom"}], "nInserted": 0})
+    applied = fake_writes(monkeypatch, {"batches": [error]})
+    counter = ViewCounter()
+    first, second = ObjectId(), ObjectId()
+
+    async def scenario():
+        counter.add(first)
+        counter.add(second)
+        counter.add(second)
+        await counter.flush()
+        assert applied["batches"] == {first: 1}
+        # Still shown in the admin view until it is written
+        assert counter.pending(second) == 2
+        await counter.flush()
+
+    asyncio.run(scenario())
+    assert applied["batches"] == {first: 1, second: 2}
+    assert applied["stats"] == {"views": 3}
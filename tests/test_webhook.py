@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import FileShareMongoDB as bot_module
+
+SECRET = "test-secret"
+RECORDED_UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 5,
+        "date": 1700000000,
+        "chat": {"id": 7, "type": "private"},
+        "from": {"id": 7, "is_bot": False, "first_name": "Test"},
+        "text": "/start"
+    }
+}
+
+
+def post_update(monkeypatch, headers, **kwargs):
+    # Runs the webhook server in-process and returns (status, updates handed to the bot)
+    monkeypatch.setattr(bot_module, "WEBHOOK_SECRET", SECRET)
+    bot_app = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+
+    async def scenario():
+        async with TestClient(TestServer(bot_module.webhook_server(bot_app))) as client:
+            response = await client.post(bot_module.WEBHOOK_PATH, headers=headers, **kwargs)
+            updates = []
+            while not bot_app.update_queue.empty():
+                updates.append(bot_app.update_queue.get_nowait())
+            return response.status, updates
+
+    return asyncio.run(scenario())
+
+
+def test_wrong_or_missing_secret_is_rejected(monkeypatch):
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+        status, updates = post_update(monkeypatch, headers, json=RECORDED_UPDATE)
+        assert status == 403
+        assert updates == []
+
+
+def test_malformed_body_is_rejected(monkeypatch):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    for body in ({"data": "{not json"}, {"json": [1, 2]}, {"json": {"message": {}}}):
+        status, updates = post_update(monkeypatch, headers, **body)
+        assert status == 400
+        assert updates == []
+
+
+def test_valid_update_reaches_the_bot(monkeypatch):
+    status, updates = post_update(monkeypatch, {"X-Telegram-Bot-Api-Secret-Token": SECRET}, json=RECORDED_UPDATE)
+    assert status == 200
+    assert [update.update_id for update in updates] == [1001]
+    assert updates[0].message.text == "/start"
+
+
+def test_webhook_mode_requires_a_secret(monkeypatch):
+    monkeypatch.setattr(bot_module, "WEBHOOK_SECRET", "")
+    try:
+        asyncio.run(bot_module.run_webhook(SimpleNamespace()))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("run_webhook started without WEBHOOK_SECRET")